@@ -0,0 +1,80 @@
+"""
+Balance Board Acquisition Process - serial reading and parsing off the GUI's interpreter
+Samples are published to a SharedSampleRing that any process can attach to by name
+"""
+
+import multiprocessing
+
+import serial
+
+from balanceboardbuffer import SharedSampleRing
+from balanceboardframing import StreamDecoder
+from balanceboardsources import open_source
+
+
+def run_acquisition(port, baudrate, max_latency, protocol, ring_name, stop):
+    """Child process body: source -> decoder -> shared ring until stop is set"""
+    ring = SharedSampleRing(name=ring_name)
+    try:
+        source = open_source(port, baudrate, max_latency)
+    except (serial.SerialException, OSError) as e:
+        print(f"Error: Could not open serial port {port}")
+        print(f"Details: {e}")
+        ring.close()
+        return
+
+    print(f"Connected to {source} (acquisition process)\n")
+    decoder = StreamDecoder(protocol)
+
+    try:
+        while not stop.is_set():
+            chunk = source.read()
+            if chunk:
+                samples = decoder.decode(chunk)
+                if len(samples):
+                    ring.append(samples)
+                ring.header[ring.OVERSIZE] = decoder.framer.oversize
+                ring.header[ring.LOST_FRAMES] = decoder.frames.lost_frames
+                ring.header[ring.REJECTED] = decoder.stats.rejected
+    except (OSError, EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        source.close()
+        ring.close()
+
+
+class AcquisitionProcess:
+    """Serial acquisition and parsing in a separate process
+
+    port is a source spec string (see balanceboardsources), opened in the child.
+    Samples go into the ring as decoded: forces-only lines keep NaN COPx and
+    COPy, so the consumer's CopCheck both fills them in and counts them.
+
+    Consumers read self.ring (or attach with SharedSampleRing(name=...)) without
+    anything passing through pipes, so GUI stalls and GIL contention in the
+    consumer never delay the serial reads.
+    """
+
+    def __init__(self, port, baudrate=115200, max_latency=0.05, protocol='auto',
+                 capacity=300000):
+        self.ring = SharedSampleRing(capacity)
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=run_acquisition, daemon=True,
+            args=(port, baudrate, max_latency, protocol, self.ring.name, self.stop_event))
+
+    def start(self):
+        self.process.start()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout=2.0):
+        """Stop the child and free the shared memory"""
+        self.stop_event.set()
+        if self.process.pid is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.ring.close()
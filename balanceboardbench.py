@@ -0,0 +1,708 @@
+"""
+Balance Board Benchmarks - run without hardware (Linux/macOS pty)
+Usage: python balanceboardbench.py <benchmark> [options]
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from balanceboardbuffer import TrailBuffer
+from balanceboardcop import BoardGeometry
+from balanceboardfilter import CHANNELS, LowPassFilter
+from balanceboardframing import LineFramer, StreamDecoder, encode_frames
+from balanceboardmetrics import SlidingSway, SwayMetrics, ellipse_area, session_metrics
+from balanceboardmulti import MultiBoardReceiver
+from balanceboardparser import (SMALL_BATCH, _parse_bulk, _parse_small, empty_samples,
+                                format_samples, parse_lines)
+from balanceboardreceiver import OUTPUT_MODES, BalanceBoardReceiver, ConsoleOutput
+from balanceboardrecorder import SessionRecorder
+from balanceboardreplay import replay_csv
+from balanceboardsimulator import BoardSimulator, SwayModel
+from balanceboardspectrum import SwaySpectrum
+
+SAMPLE_LINE = b"123456,12.34,11.98,13.02,12.50,-1.23,2.46\n"
+
+
+def open_pty():
+    """Return (master_fd, slave_path, slave_fd) of a fresh pseudo-terminal"""
+    master, slave = os.openpty()
+    path = os.ttyname(slave)
+    # Keep the slave end open so the master never sees EIO while the reader reconnects
+    return master, path, slave
+
+
+def feed_lines(master, rate, stop):
+    """Write SAMPLE_LINE at `rate` lines/s (0 = stay silent) until stop is set
+
+    Writes never block: lines the reader leaves in a full pty are dropped,
+    so a reader that died can't hang the bench.
+    """
+    if rate <= 0:
+        stop.wait()
+        return
+    os.set_blocking(master, False)
+    period = 1.0 / rate
+    next_t = time.perf_counter()
+    while not stop.is_set():
+        try:
+            os.write(master, SAMPLE_LINE)
+        except BlockingIOError:
+            pass
+        next_t += period
+        delay = next_t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def bench_cpu(args):
+    """CPU usage of BalanceBoardReceiver.start() per read mode and data rate"""
+    print(f"{'mode':<10}{'rate (lines/s)':>16}{'CPU %':>10}")
+    for rate in args.rates:
+        for mode in ('poll', 'blocking'):
+            master, path, slave = open_pty()
+            stop = threading.Event()
+            # One redirect for the receiver's whole life: it prints each line it reads,
+            # and reports the repeated SAMPLE_LINE's duplicate TIME on stderr
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                    contextlib.redirect_stderr(devnull):
+                receiver = BalanceBoardReceiver(path, read_mode=mode, max_latency=args.max_latency)
+                writer = threading.Thread(target=feed_lines, args=(master, rate, stop),
+                                          daemon=True)
+                reader = threading.Thread(target=receiver.start, daemon=True)
+                writer.start()
+                reader.start()
+                cpu0, wall0 = time.process_time(), time.perf_counter()
+                time.sleep(args.duration)
+                cpu = time.process_time() - cpu0
+                wall = time.perf_counter() - wall0
+                receiver.stop()
+                stop.set()
+                reader.join()
+                writer.join()
+                receiver.close()
+
+            os.close(master)
+            os.close(slave)
+            print(f"{mode:<10}{rate:>16}{100 * cpu / wall:>10.1f}")
+
+
+def legacy_split(chunks):
+    """The old str-concatenation framing, for reference"""
+    buffer = ""
+    count = 0
+    for chunk in chunks:
+        buffer += chunk.decode('utf-8', errors='ignore')
+        while '\n' in buffer:
+            line, buffer = buffer.split('\n', 1)
+            count += 1
+    return count
+
+
+def framer_split(chunks):
+    framer = LineFramer()
+    count = 0
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    return count
+
+
+def bench_framer(args):
+    """Lines/s of LineFramer vs the old str buffer at different chunk sizes"""
+    stream = SAMPLE_LINE * args.lines
+    print(f"{'chunk (bytes)':>14}{'legacy lines/s':>18}{'framer lines/s':>18}")
+    for size in args.chunk_sizes:
+        chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+        rates = []
+        for split in (legacy_split, framer_split):
+            t0 = time.perf_counter()
+            count = split(chunks)
+            rates.append(count / (time.perf_counter() - t0))
+            assert count == args.lines
+        print(f"{size:>14}{rates[0]:>18,.0f}{rates[1]:>18,.0f}")
+
+
+def legacy_parse(lines):
+    """The old per-line float() parsing, for reference"""
+    rows = []
+    for line in lines:
+        line = line.decode('utf-8', errors='ignore').strip()
+        parts = line.split(',')
+        if len(parts) == 7:
+            try:
+                rows.append((float(parts[1]), float(parts[2]), float(parts[3]),
+                             float(parts[4]), float(parts[5]), float(parts[6])))
+            except ValueError:
+                pass
+    return len(rows)
+
+
+def bench_parser(args):
+    """Samples/s of per-line float() vs parse_lines' two paths at different batch sizes"""
+    print(f"parse_lines goes line by line below {SMALL_BATCH} lines, vectorised from there")
+    paths = (('legacy', legacy_parse), ('per line', lambda b: len(_parse_small(b))),
+             ('vectorised', lambda b: len(_parse_bulk(b))),
+             ('parse_lines', lambda b: len(parse_lines(b))))
+    print(f"{'batch (lines)':>14}" + ''.join(f"{name + ' samples/s':>24}" for name, _ in paths))
+    for size in args.batch_sizes:
+        lines = SAMPLE_LINE.rstrip(b'\n').split(b'\n') * size
+        batches = max(1, args.samples // size)
+        rates = []
+        for _, parse in paths:
+            t0 = time.perf_counter()
+            for _ in range(batches):
+                count = parse(lines)
+            rates.append(batches * count / (time.perf_counter() - t0))
+        print(f"{size:>14}" + ''.join(f"{rate:>24,.0f}" for rate in rates))
+
+
+def make_visualizer(**kwargs):
+    """BalanceBoardVisualizer on the Agg backend, connected to an idle pty"""
+    import matplotlib
+    matplotlib.use('Agg')
+    from balanceboardvisualiser import BalanceBoardVisualizer
+
+    master, path, slave = open_pty()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        visualizer = BalanceBoardVisualizer(path, **kwargs)
+    return visualizer, master, slave
+
+
+def sway_batch(start, n, rate=1000.0):
+    """n synthetic samples of slow circular sway starting at sample index start"""
+    t = (start + np.arange(n)) / rate
+    samples = empty_samples(n)
+    samples['time'] = t * 1000
+    samples['copx'] = 8 * np.sin(0.7 * t)
+    samples['copy'] = 6 * np.cos(0.5 * t)
+    # Forces that put 80 Kg at that COP, so the COP check has nothing to report
+    samples['f1'], samples['f2'], samples['f3'], samples['f4'] = BoardGeometry().split(
+        80.0, samples['copx'], samples['copy'])
+    return samples
+
+
+def bench_render(args):
+    """Frames/s of BalanceBoardVisualizer.update + draw under Agg, blit vs full redraw"""
+    print(f"{'mode':<8}{'frames/s':>12}")
+    for blit in (False, True):
+        visualizer, master, slave = make_visualizer(blit=blit, spectrum=args.spectrum)
+        canvas = visualizer.fig.canvas
+        if blit:
+            # What FuncAnimation does: draw once without the animated artists, cache it
+            for artist in visualizer.animated_artists:
+                artist.set_animated(True)
+            canvas.draw()
+            background = canvas.copy_from_bbox(visualizer.fig.bbox)
+        else:
+            canvas.draw()
+
+        per_frame = int(args.sample_rate / 60)
+        t0 = time.perf_counter()
+        for frame in range(args.frames):
+            visualizer.history.append(sway_batch(frame * per_frame, per_frame, args.sample_rate))
+            artists = visualizer.update(frame)
+            if blit:
+                canvas.restore_region(background)
+                for artist in sorted(artists, key=lambda a: a.get_zorder()):
+                    visualizer.fig.draw_artist(artist)
+                canvas.blit(visualizer.fig.bbox)
+            else:
+                canvas.draw()
+        fps = args.frames / (time.perf_counter() - t0)
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            visualizer.close()
+        os.close(master)
+        os.close(slave)
+        print(f"{'blit' if blit else 'full':<8}{fps:>12.1f}")
+
+
+def bench_trail(args):
+    """us per frame to update the COP trail line: list pop(0) + set_data vs TrailBuffer
+
+    Each frame appends one batch, hands the trail to the Line2D and has it
+    converted the way a draw does (Line2D.recache), so the list-to-array
+    rebuild the old code paid on every frame is in the numbers.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.lines import Line2D
+
+    batch = sway_batch(0, args.batch)
+    xs, ys = batch['copx'], batch['copy']
+    print(f"{'length':>8}{'list us/frame':>16}{'ring us/frame':>16}{'speed-up':>10}")
+    for length in args.lengths:
+        # Start both full, as they are after the first seconds of a session
+        line = Line2D([], [])
+        trail_x, trail_y = [0.0] * length, [0.0] * length
+        t0 = time.perf_counter()
+        for _ in range(args.batches):
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                trail_x.append(x)
+                trail_y.append(y)
+                if len(trail_x) > length:
+                    trail_x.pop(0)
+                    trail_y.pop(0)
+            line.set_data(trail_x, trail_y)
+            line.recache()
+        list_us = (time.perf_counter() - t0) / args.batches * 1e6
+
+        line = Line2D([], [])
+        trail = TrailBuffer(length)
+        trail.extend(np.zeros(length), np.zeros(length))
+        t0 = time.perf_counter()
+        for _ in range(args.batches):
+            trail.extend(xs, ys)
+            line.set_data(*trail.view())
+            line.recache()
+        ring_us = (time.perf_counter() - t0) / args.batches * 1e6
+        print(f"{length:>8}{list_us:>16.1f}{ring_us:>16.1f}{list_us / ring_us:>9.1f}x")
+    print(f"({args.batch} samples per frame: 1 kHz at 60 fps)")
+
+
+def bench_decode(args):
+    """Samples/s and bytes/sample decoding CSV text vs binary frames, and lost-frame counts"""
+    samples = sway_batch(0, args.samples)
+    streams = {
+        'text': b''.join(line + b'\n' for line in format_samples(samples)),
+        'binary': encode_frames(samples),
+    }
+    print(f"{'protocol':<10}{'bytes/sample':>14}{'samples/s':>14}{'max @115200':>14}")
+    for protocol, stream in streams.items():
+        decoder = StreamDecoder(protocol)
+        chunks = [stream[i:i + args.chunk] for i in range(0, len(stream), args.chunk)]
+        t0 = time.perf_counter()
+        count = sum(len(decoder.decode(chunk)) for chunk in chunks)
+        rate = count / (time.perf_counter() - t0)
+        per_sample = len(stream) / args.samples
+        # 10 bits on the wire per byte (start + 8 data + stop)
+        print(f"{protocol:<10}{per_sample:>14.1f}{rate:>14,.0f}{11520 / per_sample:>14.0f}")
+
+    # Lost frames by seq: (case, seq batches, expected lost, expected restarts)
+    cases = [('in order', [range(100)], 0, 0),
+             ('wrap', [range(65500, 65536), range(10)], 0, 0),
+             ('gap', [range(50), range(60, 100)], 10, 0),
+             ('late frame', [[5, 4, 6]], 0, 0),
+             ('early frame', [[1, 2, 3, 10, *range(4, 10), 11]], 0, 0),
+             ('restart', [range(100), range(50), [60]], 10, 1)]
+    print(f"\n{'seq case':<14}{'lost':>6}{'expected':>10}{'restarts':>10}{'expected':>10}")
+    for case, batches, lost, restarts in cases:
+        decoder = StreamDecoder('binary')
+        for seq in batches:
+            decoder.decode(b''.join(encode_frames(sway_batch(i, 1), i) for i in seq))
+        print(f"{case:<14}{decoder.frames.lost_frames:>6}{lost:>10}"
+              f"{decoder.frames.resets:>10}{restarts:>10}")
+
+
+def bench_record(args):
+    """Samples/s of the print-per-line path vs SessionRecorder, both to a file"""
+    lines = format_samples(sway_batch(0, args.batch))
+    total = args.batch * args.batches
+    print(f"{'path':<10}{'reader samples/s':>18}{'end-to-end samples/s':>22}{'file bytes':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # What people do today: python balanceboardreceiver.py > session.txt
+        path = os.path.join(tmp, 'session.txt')
+        with open(path, 'w') as out, contextlib.redirect_stdout(out):
+            t0 = time.perf_counter()
+            for _ in range(args.batches):
+                for line in lines:
+                    line = line.decode('utf-8', errors='ignore').strip()
+                    if line:
+                        print(line, flush=True)
+            elapsed = time.perf_counter() - t0
+        rate = total / elapsed
+        print(f"{'print':<10}{rate:>18,.0f}{rate:>22,.0f}{os.path.getsize(path):>12,}")
+
+        path = os.path.join(tmp, 'session.bbs')
+        recorder = SessionRecorder(path)
+        t0 = time.perf_counter()
+        for _ in range(args.batches):
+            recorder.write(parse_lines(lines))
+        reader = time.perf_counter() - t0
+        recorder.close()
+        elapsed = time.perf_counter() - t0
+        print(f"{'record':<10}{total / reader:>18,.0f}{total / elapsed:>22,.0f}"
+              f"{os.path.getsize(path):>12,}")
+
+
+def bench_console(args):
+    """Lines/s and CPU of each console output mode, piped into another process"""
+    lines = format_samples(sway_batch(0, args.batch))
+    total = args.batch * args.batches
+    print(f"{'mode':<10}{'lines/s':>12}{'MB/s':>8}{'CPU us/line':>13}")
+    for mode in OUTPUT_MODES:
+        sink = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        stream = io.TextIOWrapper(sink.stdin)
+        console = ConsoleOutput(mode, stream)
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        for _ in range(args.batches):
+            console.write(lines)
+            console.poll()
+        console.flush()
+        stream.flush()
+        cpu = time.process_time() - cpu0
+        elapsed = time.perf_counter() - t0
+        stream.close()
+        sink.wait()
+        size = sum(len(line) + 1 for line in lines) * args.batches
+        print(f"{mode:<10}{total / elapsed:>12,.0f}{size / elapsed / 1e6:>8.1f}"
+              f"{1e6 * cpu / total:>13.2f}")
+
+
+def feed_boards(masters, rate, duration, tick=0.01):
+    """Child process: write `rate` simulated samples/s to every pty master for `duration` s"""
+    models = [SwayModel(rate, seed=i) for i in range(len(masters))]
+    per_tick = max(1, int(rate * tick))
+    end = time.perf_counter() + duration
+    next_t = time.perf_counter()
+    while next_t < end:
+        for master, model in zip(masters, models):
+            os.write(master, b'\n'.join(format_samples(model.next(per_tick))) + b'\n')
+        next_t += tick
+        delay = next_t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def bench_multi(args):
+    """Total samples/s and CPU of MultiBoardReceiver for 1..N simulated boards"""
+    print(f"{'boards':>7}{'samples/s':>12}{'per board':>11}{'CPU %':>8}")
+    for count in args.boards:
+        ptys = [open_pty() for _ in range(count)]
+        writer = multiprocessing.get_context('fork').Process(
+            target=feed_boards, args=([master for master, _, _ in ptys], args.rate, args.duration))
+
+        # Anything the boards report (lost samples when the pty fills) would interleave
+        # with the table
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            receiver = MultiBoardReceiver([path for _, path, _ in ptys],
+                                          on_samples=lambda name, samples: None)
+            writer.start()
+            cpu0, t0 = time.process_time(), time.perf_counter()
+            while writer.is_alive():
+                receiver.poll(0.05)
+            receiver.poll(0.05)
+            cpu = time.process_time() - cpu0
+            elapsed = time.perf_counter() - t0
+            writer.join()
+            receiver.close()
+
+        total = sum(board.samples for board in receiver.boards)
+        for master, _, slave in ptys:
+            os.close(master)
+            os.close(slave)
+        print(f"{count:>7}{total / elapsed:>12,.0f}{total / elapsed / count:>11,.0f}"
+              f"{100 * cpu / elapsed:>8.1f}")
+
+
+def bench_load(args):
+    """Receiver throughput and CPU fed by the pty simulator with no baud limit"""
+    print(f"{'protocol':<10}{'rate':>8}{'received/s':>12}{'CPU %':>8}")
+    for protocol in args.protocols:
+        for rate in args.rates:
+            simulator = BoardSimulator(rate, baudrate=0, protocol=protocol, seed=0)
+            received = []
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                receiver = BalanceBoardReceiver(simulator.path, protocol=protocol, output='none',
+                                                on_samples=lambda s: received.append(len(s)))
+            feeder = multiprocessing.get_context('fork').Process(target=simulator.run,
+                                                                 args=(args.duration,))
+            reader = threading.Thread(target=receiver.start, daemon=True)
+            reader.start()
+            cpu0, t0 = time.process_time(), time.perf_counter()
+            feeder.start()
+            feeder.join()
+            time.sleep(0.2)
+            receiver.stop()
+            reader.join()
+            cpu = time.process_time() - cpu0
+            elapsed = time.perf_counter() - t0
+
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                receiver.close()
+            simulator.close()
+            print(f"{protocol:<10}{rate:>8.0f}{sum(received) / args.duration:>12,.0f}"
+                  f"{100 * cpu / elapsed:>8.1f}")
+
+
+def bench_replay(args):
+    """Seconds to replay a recorded session at maximum speed, per wire protocol"""
+    rate = 1000.0
+    print(f"{'protocol':<10}{'session':>10}{'seconds':>10}{'x real time':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'session.bbs')
+        recorder = SessionRecorder(path, fsync=False)
+        total = int(args.minutes * 60 * rate)
+        for start in range(0, total, 100000):
+            recorder.write(sway_batch(start, min(100000, total - start), rate))
+        recorder.close()
+
+        for protocol in ('text', 'binary'):
+            with open(os.devnull, 'wb') as out:
+                t0 = time.perf_counter()
+                replay_csv(path, out, None, protocol)
+                elapsed = time.perf_counter() - t0
+            print(f"{protocol:<10}{args.minutes:>8g} m{elapsed:>10.2f}"
+                  f"{args.minutes * 60 / elapsed:>13.0f}")
+
+
+def reference_metrics(samples):
+    """Per-sample loop over a recording, as batch reports computed it before"""
+    n = path = sx = sy = sxx = syy = sxy = load = left = front = 0.0
+    low_x = low_y = float('inf')
+    high_x = high_y = float('-inf')
+    prev = None
+    for t, f1, f2, f3, f4, x, y in samples.tolist():
+        if prev is not None:
+            path += ((x - prev[0]) ** 2 + (y - prev[1]) ** 2) ** 0.5
+        prev = (x, y)
+        n += 1
+        sx += x
+        sy += y
+        sxx += x * x
+        syy += y * y
+        sxy += x * y
+        low_x, high_x = min(low_x, x), max(high_x, x)
+        low_y, high_y = min(low_y, y), max(high_y, y)
+        load += f1 + f2 + f3 + f4
+        left += f2 + f3
+        front += f1 + f2
+    duration = (samples['time'][-1] - samples['time'][0]) / 1000.0
+    var_ml, var_ap = sxx / n - (sx / n) ** 2, syy / n - (sy / n) ** 2
+    cov = sxy / n - sx / n * sy / n
+    return {'path_length': path, 'mean_velocity': path / duration,
+            'rms': (var_ml + var_ap) ** 0.5, 'range_ml': high_x - low_x,
+            'range_ap': high_y - low_y, 'ellipse_area': ellipse_area(int(n), var_ml, var_ap, cov),
+            'left_pct': 100 * left / load, 'front_pct': 100 * front / load}
+
+
+def bench_metrics(args):
+    """Seconds for sway/force metrics of a recording: reference loop, vectorised, streaming"""
+    samples = SwayModel(1000.0, seed=0).next(int(args.minutes * 60 * 1000))
+    samples['copx'] += 3.0
+
+    t0 = time.perf_counter()
+    reference = reference_metrics(samples)
+    loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    vectorised = session_metrics(samples)
+    whole = time.perf_counter() - t0
+
+    streaming = SwayMetrics(windows=())
+    t0 = time.perf_counter()
+    for start in range(0, len(samples), args.batch):
+        streaming.update(samples[start:start + args.batch])
+    streamed = time.perf_counter() - t0
+    streaming = streaming.results()['session']
+
+    def worst(a, b):
+        return max(abs(a[key] - b[key]) / max(abs(b[key]), 1e-12) for key in a if key in b)
+
+    print(f"{'method':<12}{'seconds':>10}{'max rel diff':>15}")
+    print(f"{'loop':<12}{loop:>10.3f}{'(reference)':>15}")
+    print(f"{'vectorised':<12}{whole:>10.3f}{worst(reference, vectorised):>15.1e}")
+    print(f"{'streaming':<12}{streamed:>10.3f}{worst(streaming, vectorised):>15.1e}")
+    print(f"({len(samples):,} samples; streaming fed in batches of {args.batch}, "
+          f"compared with vectorised)")
+
+
+def bench_spectrum(args):
+    """ms per GUI frame for the sway spectrum: SwaySpectrum vs Welch redone every frame"""
+    rate, per_frame = 1000.0, int(1000.0 / 60)
+    samples = SwayModel(rate, seed=0).next(int(args.seconds * rate))
+    frames = len(samples) // per_frame
+
+    spectrum = SwaySpectrum(rate)
+    t0 = time.perf_counter()
+    for frame in range(frames):
+        spectrum.update(samples[frame * per_frame:(frame + 1) * per_frame])
+    hopped = (time.perf_counter() - t0) / frames * 1000
+
+    # The same PSD from scratch: every segment of the window, tapered and transformed
+    size, hop, count = spectrum.size, spectrum.hop, spectrum.count
+    xy = np.stack((samples['copx'], samples['copy']))
+    t0 = time.perf_counter()
+    for frame in range(frames):
+        end = (frame + 1) * per_frame
+        starts = range(max(0, end - size - (count - 1) * hop), end - size + 1, hop)
+        if not len(starts):
+            continue
+        segments = np.stack([xy[:, start:start + size] for start in starts])
+        segments -= segments.mean(axis=2, keepdims=True)
+        power = np.abs(np.fft.rfft(segments * np.hanning(size + 1)[:-1], axis=2)) ** 2
+        psd = power[:, :, :spectrum.bins].mean(axis=0) * spectrum.scale
+    redone = (time.perf_counter() - t0) / frames * 1000
+
+    print(f"{'method':<14}{'ms/frame':>10}")
+    print(f"{'every frame':<14}{redone:>10.3f}")
+    print(f"{'per hop':<14}{hopped:>10.3f}")
+    print(f"({frames} frames of {per_frame} samples; {count} segments of {size} samples, "
+          f"hop {hop}; max diff {np.abs(psd - spectrum.psd()[1]).max():.1e})")
+
+
+def bench_sliding(args):
+    """SlidingSway against brute force (session_metrics of the window) per rate and batch"""
+    keys = ('samples', 'duration', 'path_length', 'mean_velocity', 'rms', 'rms_ml', 'rms_ap',
+            'range_ml', 'range_ap', 'ellipse_area')
+    print(f"{'rate (Hz)':>10}{'batch':>8}{'window samples':>16}{'max rel diff':>15}")
+    worst = 0.0
+    for rate in args.rates:
+        samples = SwayModel(rate, seed=0).next(int(args.seconds * rate))
+        samples['copx'] += 3.0
+        for batch in args.batch_sizes:
+            window = SlidingSway(args.window, args.max_rate)
+            diff = 0.0
+            for start in range(0, len(samples), batch):
+                end = min(start + batch, len(samples))
+                window.update(samples[start:end])
+                # The window: the last `window` seconds, at most capacity - 1 samples
+                times = samples['time'][:end]
+                first = max(np.searchsorted(times, times[-1] - args.window * 1000.0, 'right'),
+                            end - window.capacity + 1)
+                got, want = window.result(), session_metrics(samples[first:end])
+                diff = max(diff, max(abs(got[key] - want[key]) / max(abs(want[key]), 1e-9)
+                                     for key in keys))
+            worst = max(worst, diff)
+            print(f"{rate:>10g}{batch:>8}{got['samples']:>16}{diff:>15.1e}")
+    print(f"worst {worst:.1e} ({args.window:g} s window, ring sized for {args.max_rate:g} Hz)")
+
+
+def sos_loop(sos, x, state):
+    """Per-sample transposed direct form II over (n, channels) x; state (sections, 2, channels)"""
+    y = x.copy()
+    for (b0, b1, b2, _, a1, a2), (z1, z2) in zip(sos, state):
+        for n in range(len(y)):
+            xn = y[n]
+            yn = b0 * xn + z1
+            z1, z2 = b1 * xn - a1 * yn + z2, b2 * xn - a2 * yn
+            y[n] = yn
+    return y
+
+
+def bench_filter(args):
+    """Samples/s through the 6-channel low-pass: per-sample SOS loop vs LowPassFilter"""
+    samples = SwayModel(1000.0, seed=0).next(args.samples)
+    x = np.column_stack([samples[name] for name in CHANNELS])
+
+    lowpass = LowPassFilter(args.cutoff, 1000.0)
+    state = np.array([section.steady(x[0]) for section in lowpass.sections])
+    t0 = time.perf_counter()
+    reference = sos_loop(lowpass.sos, x, state)
+    loop = args.samples / (time.perf_counter() - t0)
+
+    print(f"{'batch':>8}{'samples/s':>14}{'max diff':>12}")
+    print(f"{'loop':>8}{loop:>14,.0f}{'':>12}")
+    for batch in args.batch_sizes:
+        lowpass = LowPassFilter(args.cutoff, 1000.0)
+        t0 = time.perf_counter()
+        out = [lowpass.filter(samples[i:i + batch]) for i in range(0, args.samples, batch)]
+        rate = args.samples / (time.perf_counter() - t0)
+        out = np.concatenate(out)
+        diff = np.abs(np.column_stack([out[name] for name in CHANNELS]) - reference).max()
+        print(f"{batch:>8}{rate:>14,.0f}{diff:>12.1e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('cpu', help=bench_cpu.__doc__)
+    p.add_argument('--rates', type=int, nargs='+', default=[0, 100, 1000])
+    p.add_argument('--duration', type=float, default=3.0)
+    p.add_argument('--max-latency', type=float, default=0.05)
+    p.set_defaults(func=bench_cpu)
+
+    p = sub.add_parser('framer', help=bench_framer.__doc__)
+    p.add_argument('--lines', type=int, default=200000)
+    p.add_argument('--chunk-sizes', type=int, nargs='+', default=[16, 64, 512, 4096, 65536])
+    p.set_defaults(func=bench_framer)
+
+    p = sub.add_parser('parser', help=bench_parser.__doc__)
+    p.add_argument('--samples', type=int, default=200000)
+    p.add_argument('--batch-sizes', type=int, nargs='+',
+                   default=[1, 10, 20, 30, 50, 100, 1000, 10000])
+    p.set_defaults(func=bench_parser)
+
+    p = sub.add_parser('render', help=bench_render.__doc__)
+    p.add_argument('--frames', type=int, default=200)
+    p.add_argument('--sample-rate', type=float, default=1000.0)
+    p.add_argument('--spectrum', action='store_true', help="with the sway spectrum panel")
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser('trail', help=bench_trail.__doc__)
+    p.add_argument('--lengths', type=int, nargs='+', default=[20, 1000, 5000, 20000])
+    p.add_argument('--batch', type=int, default=17)
+    p.add_argument('--batches', type=int, default=2000)
+    p.set_defaults(func=bench_trail)
+
+    p = sub.add_parser('decode', help=bench_decode.__doc__)
+    p.add_argument('--samples', type=int, default=100000)
+    p.add_argument('--chunk', type=int, default=4096)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser('record', help=bench_record.__doc__)
+    p.add_argument('--batch', type=int, default=50)
+    p.add_argument('--batches', type=int, default=2000)
+    p.set_defaults(func=bench_record)
+
+    p = sub.add_parser('console', help=bench_console.__doc__)
+    p.add_argument('--batch', type=int, default=50)
+    p.add_argument('--batches', type=int, default=4000)
+    p.set_defaults(func=bench_console)
+
+    p = sub.add_parser('multi', help=bench_multi.__doc__)
+    p.add_argument('--boards', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    p.add_argument('--rate', type=float, default=1000.0, help="samples/s per board")
+    p.add_argument('--duration', type=float, default=3.0)
+    p.set_defaults(func=bench_multi)
+
+    p = sub.add_parser('load', help=bench_load.__doc__)
+    p.add_argument('--rates', type=float, nargs='+', default=[1000, 10000, 50000])
+    p.add_argument('--protocols', nargs='+', default=['text', 'binary'])
+    p.add_argument('--duration', type=float, default=3.0)
+    p.set_defaults(func=bench_load)
+
+    p = sub.add_parser('replay', help=bench_replay.__doc__)
+    p.add_argument('--minutes', type=float, default=10.0, help="session length at 1 kHz")
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser('metrics', help=bench_metrics.__doc__)
+    p.add_argument('--minutes', type=float, default=10.0, help="recording length at 1 kHz")
+    p.add_argument('--batch', type=int, default=50)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser('sliding', help=bench_sliding.__doc__)
+    p.add_argument('--rates', type=float, nargs='+', default=[100, 1000, 2000, 5000])
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[17, 1000, 30000])
+    p.add_argument('--seconds', type=float, default=30.0, help="stream length")
+    p.add_argument('--window', type=float, default=10.0)
+    p.add_argument('--max-rate', type=float, default=2000.0)
+    p.set_defaults(func=bench_sliding)
+
+    p = sub.add_parser('filter', help=bench_filter.__doc__)
+    p.add_argument('--samples', type=int, default=100000)
+    p.add_argument('--cutoff', type=float, default=10.0)
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 50, 1000, 100000])
+    p.set_defaults(func=bench_filter)
+
+    p = sub.add_parser('spectrum', help=bench_spectrum.__doc__)
+    p.add_argument('--seconds', type=float, default=120.0, help="stream length at 1 kHz")
+    p.set_defaults(func=bench_spectrum)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
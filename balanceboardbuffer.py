@@ -0,0 +1,190 @@
+"""
+Balance Board Sample Buffers - fixed-size NumPy rings
+"""
+
+import multiprocessing
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from balanceboardparser import SAMPLE_DTYPE, empty_samples
+
+
+class SampleRing:
+    """Bounded ring of SAMPLE_DTYPE samples: one writer thread, any number of readers"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = empty_samples(capacity)
+        # Total samples ever appended; a reader's position is a value of this counter
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def append(self, samples):
+        """Copy a batch in, overwriting the oldest samples when full"""
+        n = len(samples)
+        with self.lock:
+            if n > self.capacity:
+                # Only the newest capacity samples can survive anyway
+                self.written += n - self.capacity
+                samples = samples[-self.capacity:]
+                n = self.capacity
+            start = self.written % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[start:start + first] = samples[:first]
+            self.data[:n - first] = samples[first:]
+            self.written += n
+
+    def read_since(self, seq):
+        """Return (samples, new_seq, lost) for everything appended after position seq
+
+        lost counts samples that were overwritten before this reader got to them.
+        """
+        with self.lock:
+            oldest = max(0, self.written - self.capacity)
+            start = max(seq, oldest)
+            samples = self._copy(start, self.written)
+            return samples, self.written, start - seq
+
+    def _copy(self, start, stop):
+        # Caller holds the lock
+        n = stop - start
+        out = empty_samples(n)
+        i = start % self.capacity
+        first = min(n, self.capacity - i)
+        out[:first] = self.data[i:i + first]
+        out[first:] = self.data[:n - first]
+        return out
+
+
+class TrailBuffer:
+    """The last `length` COP points, always readable as one contiguous slice"""
+
+    def __init__(self, length):
+        self.length = length
+        # Row 0 is x, row 1 is y. Every point is stored twice, `length` apart, so
+        # the newest `length` points never wrap around the end of the array
+        self.data = np.zeros((2, 2 * length))
+        self.head = 0
+        self.count = 0
+
+    def extend(self, x, y):
+        """Append a batch of points, dropping the oldest beyond length"""
+        n = len(x)
+        if n > self.length:
+            x, y = x[-self.length:], y[-self.length:]
+            n = self.length
+        if n == 0:
+            return
+
+        head, length = self.head, self.length
+        stop = head + n
+        self.data[0, head:stop] = x
+        self.data[1, head:stop] = y
+
+        # Mirror into the other half: [head, length) -> +length, [length, stop) -> -length
+        split = min(stop, length)
+        self.data[:, head + length:split + length] = self.data[:, head:split]
+        if stop > length:
+            self.data[:, :stop - length] = self.data[:, length:stop]
+
+        self.head = stop % length
+        self.count = min(self.count + n, length)
+
+    def view(self):
+        """(x, y) views of the trail, oldest first - no copy"""
+        start = (self.head - self.count) % self.length
+        stop = start + self.count
+        return self.data[0, start:stop], self.data[1, start:stop]
+
+
+# Blocks created by this process (they stay registered with our resource tracker)
+_created = set()
+
+
+class SharedSampleRing:
+    """SampleRing in shared memory, written by one process and read by others
+
+    No lock crosses the process boundary. The writer bumps `reserved` before
+    copying a batch and `written` after it; a reader copies, then discards
+    anything the writer may have reached in the meantime (counted as lost).
+    """
+
+    # u64 slots at the start of the block
+    WRITTEN, RESERVED, CAPACITY, OVERSIZE, LOST_FRAMES, REJECTED = range(6)
+    HEADER = 64
+
+    def __init__(self, capacity=None, name=None):
+        if name is None:
+            size = self.HEADER + capacity * SAMPLE_DTYPE.itemsize
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+            _created.add(self.shm.name)
+        elif sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+            self.owner = False
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            if multiprocessing.parent_process() is None and name not in _created:
+                # An unrelated process's resource tracker would unlink the block on exit
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.name = self.shm.name
+        self.header = np.ndarray(self.HEADER // 8, np.uint64, self.shm.buf)
+        if self.owner:
+            self.header[:] = 0
+            self.header[self.CAPACITY] = capacity
+        # The block may be rounded up to whole pages, so the size can't tell us this
+        self.capacity = int(self.header[self.CAPACITY])
+        self.data = np.ndarray(self.capacity, SAMPLE_DTYPE, self.shm.buf, self.HEADER)
+
+    @property
+    def written(self):
+        return int(self.header[self.WRITTEN])
+
+    def append(self, samples):
+        """Copy a batch in, overwriting the oldest samples when full (writer only)"""
+        n = len(samples)
+        written = self.written
+        if n > self.capacity:
+            written += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+        self.header[self.RESERVED] = written + n
+        start = written % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.header[self.WRITTEN] = written + n
+
+    def read_since(self, seq):
+        """Return (samples, new_seq, lost) for everything appended after position seq"""
+        written = self.written
+        start = max(seq, written - self.capacity, 0)
+        samples = self._copy(start, written)
+        # Slots the writer may have touched during the copy can't be trusted
+        safe = min(int(self.header[self.RESERVED]) - self.capacity, written)
+        if safe > start:
+            samples = samples[safe - start:]
+            start = safe
+        return samples, written, start - seq
+
+    def _copy(self, start, stop):
+        n = max(0, stop - start)
+        out = empty_samples(n)
+        i = start % self.capacity
+        first = min(n, self.capacity - i)
+        out[:first] = self.data[i:i + first]
+        out[first:] = self.data[:n - first]
+        return out
+
+    def close(self):
+        """Detach; the creating side also frees the block"""
+        del self.header, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            _created.discard(self.name)
@@ -0,0 +1,222 @@
+"""
+Balance Board COP - centre of pressure on the host, from F1-F4 and the board geometry
+Cross-checks the device's COPx/COPy, or stands in for them (forces-only firmware,
+or COP maths fixed without reflashing)
+Sensors as drawn by the visualizer: F2 front-left, F1 front-right,
+F3 back-left, F4 back-right; x to the right, y to the front, cm from the centre
+"""
+
+import math
+
+import numpy as np
+
+from balanceboardparser import SMALL_BATCH, as_matrix
+from balanceboardreport import Reporter
+
+COP_MODES = ('device', 'host')
+# Total load (Kg) below which nobody is on the board and COP means nothing
+MIN_LOAD = 1.0
+
+
+def add_geometry_args(parser):
+    """--cop, --board and --sensors on an argparse parser (see geometry_from_args)"""
+    parser.add_argument('--cop', choices=COP_MODES, default='device',
+                        help="COP to use: the board's, checked against the host's (default), "
+                             "or the host's from F1-F4")
+    parser.add_argument('--board', type=parse_size, default=(60.0, 45.0), metavar='WxH',
+                        help="board size in cm (default 60x45)")
+    parser.add_argument('--sensors', type=parse_size, metavar='WxH',
+                        help="sensor spacing in cm, if not at the board's corners")
+
+
+def geometry_from_args(args):
+    """BoardGeometry from the options of add_geometry_args"""
+    return BoardGeometry(*args.board, *(args.sensors or ()))
+
+
+def parse_size(spec):
+    """'60x45' -> (60.0, 45.0)"""
+    try:
+        width, height = (float(v) for v in spec.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"Expected WIDTHxHEIGHT in cm, e.g. 60x45: {spec!r}")
+    return width, height
+
+
+class BoardGeometry:
+    """Board outline and where F1-F4 sit on it (cm)
+
+    The sensors form a sensor_width x sensor_height rectangle centred on the
+    board, at its corners unless given.
+    """
+
+    def __init__(self, width=60.0, height=45.0, sensor_width=None, sensor_height=None):
+        self.width = width
+        self.height = height
+        self.sensor_width = width if sensor_width is None else sensor_width
+        self.sensor_height = height if sensor_height is None else sensor_height
+        x, y = self.sensor_width / 2, self.sensor_height / 2
+        # F1..F4 positions
+        self.sensors = np.array([(x, y), (-x, y), (-x, -y), (x, -y)])
+        self.sensor_list = self.sensors.tolist()
+
+    def cop(self, samples, min_load=MIN_LOAD):
+        """(copx, copy) arrays from F1-F4; (0, 0) where the load is under min_load"""
+        forces = np.column_stack([samples[name] for name in ('f1', 'f2', 'f3', 'f4')])
+        total = forces.sum(axis=1)
+        loaded = total >= min_load
+        moments = forces @ self.sensors
+        cop = np.divide(moments, total[:, None], out=np.zeros_like(moments),
+                        where=loaded[:, None])
+        return cop[:, 0], cop[:, 1]
+
+    def split(self, load, copx, copy):
+        """F1-F4 that put load (Kg) at (copx, copy): the inverse of cop()"""
+        right = 0.5 + np.asarray(copx) / self.sensor_width
+        front = 0.5 + np.asarray(copy) / self.sensor_height
+        return (load * right * front, load * (1 - right) * front,
+                load * (1 - right) * (1 - front), load * right * (1 - front))
+
+    def __str__(self):
+        if (self.sensor_width, self.sensor_height) == (self.width, self.height):
+            return f"{self.width:g} x {self.height:g} cm board"
+        return (f"{self.width:g} x {self.height:g} cm board, "
+                f"sensors {self.sensor_width:g} x {self.sensor_height:g} cm apart")
+
+
+class CopCheck:
+    """Host COP for every batch, compared against the device's
+
+    mode 'device' keeps the device's COPx/COPy and only fills in the ones it
+    didn't send (NaN: forces-only lines); 'host' replaces them all. Either way
+    every loaded sample with a device COP is compared, and those more than
+    tolerance cm away from the host's count as diverged. Divergence goes to
+    a Reporter, with the worst sample since the last report.
+    """
+
+    def __init__(self, geometry=None, mode='device', tolerance=0.5, min_load=MIN_LOAD,
+                 report_interval=5.0, stream=None, name=None):
+        if mode not in COP_MODES:
+            raise ValueError(f"Unknown COP mode: {mode}")
+        self.geometry = geometry if geometry is not None else BoardGeometry()
+        self.mode = mode
+        self.tolerance = tolerance
+        self.min_load = min_load
+        self.reporter = Reporter(report_interval, stream, name)
+
+        self.checked = 0
+        self.diverged = 0
+        self.computed = 0
+        self.largest = 0.0
+        self.sum_sq = 0.0
+        # Device TIME of the worst divergence since the last report
+        self.worst = None
+        self.reported = 0
+
+    @property
+    def rms(self):
+        """RMS distance (cm) between device and host COP over all checked samples"""
+        return np.sqrt(self.sum_sq / self.checked) if self.checked else 0.0
+
+    def apply(self, samples):
+        """Check a batch; returns it with host COP where the mode calls for it"""
+        if not len(samples):
+            return samples
+        if len(samples) < SMALL_BATCH:
+            return self._apply_small(samples)
+        copx, copy = self.geometry.cop(samples, self.min_load)
+        device = np.isfinite(samples['copx']) & np.isfinite(samples['copy'])
+        loaded = (samples['f1'] + samples['f2'] + samples['f3'] + samples['f4']) >= self.min_load
+
+        checked = device & loaded
+        if checked.any():
+            distance = np.hypot(samples['copx'][checked] - copx[checked],
+                                samples['copy'][checked] - copy[checked])
+            self.checked += len(distance)
+            self.sum_sq += float(np.dot(distance, distance))
+            i = int(np.argmax(distance))
+            self.largest = max(self.largest, float(distance[i]))
+            over = distance > self.tolerance
+            if over.any():
+                self.diverged += int(np.count_nonzero(over))
+                if self.worst is None or distance[i] > self.worst[0]:
+                    self.worst = (float(distance[i]), float(samples['time'][checked][i]))
+                self._maybe_report()
+
+        if self.mode == 'device':
+            if device.all():
+                return samples
+            self.computed += int(np.count_nonzero(~device))
+            samples = samples.copy()
+            samples['copx'][~device] = copx[~device]
+            samples['copy'][~device] = copy[~device]
+            return samples
+        self.computed += len(samples)
+        samples = samples.copy()
+        samples['copx'] = copx
+        samples['copy'] = copy
+        return samples
+
+    def _apply_small(self, samples):
+        """apply() for a few samples, in Python floats: NumPy's per-call cost would dominate"""
+        (x1, y1), (x2, y2), (x3, y3), (x4, y4) = self.geometry.sensor_list
+        host = self.mode == 'host'
+        replace = []
+        diverged = 0
+        for i, (t, f1, f2, f3, f4, copx, copy) in enumerate(as_matrix(samples).tolist()):
+            total = f1 + f2 + f3 + f4
+            if total >= self.min_load:
+                x = (f1 * x1 + f2 * x2 + f3 * x3 + f4 * x4) / total
+                y = (f1 * y1 + f2 * y2 + f3 * y3 + f4 * y4) / total
+            else:
+                x = y = 0.0
+            device = math.isfinite(copx) and math.isfinite(copy)
+            if device and total >= self.min_load:
+                distance = math.hypot(copx - x, copy - y)
+                self.checked += 1
+                self.sum_sq += distance * distance
+                self.largest = max(self.largest, distance)
+                if distance > self.tolerance:
+                    diverged += 1
+                    if self.worst is None or distance > self.worst[0]:
+                        self.worst = (distance, t)
+            if host or not device:
+                replace.append((i, x, y))
+
+        if diverged:
+            self.diverged += diverged
+            self._maybe_report()
+        if not replace:
+            return samples
+        self.computed += len(replace)
+        samples = samples.copy()
+        for i, x, y in replace:
+            samples['copx'][i] = x
+            samples['copy'][i] = y
+        return samples
+
+    def _maybe_report(self):
+        if self.reporter.due():
+            self.report()
+
+    def report(self):
+        """Print the divergence since the last report (if any)"""
+        new = self.diverged - self.reported
+        message = None
+        if new:
+            distance, at = self.worst
+            message = (f"COP: {new} samples over {self.tolerance:g} cm from the host's "
+                       f"(worst {distance:.2f} cm at TIME {at:.0f} ms)")
+        self.reporter.report(message)
+        self.reported = self.diverged
+        self.worst = None
+
+    def as_dict(self):
+        return {'cop_checked': self.checked, 'cop_diverged': self.diverged,
+                'cop_computed': self.computed, 'cop_largest': self.largest,
+                'cop_rms': self.rms}
+
+    def summary(self):
+        return (f"{self.mode} COP, {self.geometry}; {self.checked} checked, "
+                f"{self.diverged} over {self.tolerance:g} cm (largest {self.largest:.2f} cm, "
+                f"RMS {self.rms:.3f} cm), {self.computed} computed on the host")
@@ -0,0 +1,166 @@
+"""
+Balance Board Filter - streaming low-pass filter for F1-F4, COPx and COPy
+Butterworth second-order sections, state kept between batches, all six
+channels at once; TIME passes through untouched
+"""
+
+import sys
+
+import numpy as np
+
+from balanceboardparser import FIELDS
+
+CHANNELS = FIELDS[1:]
+TARGETS = ('display', 'record', 'both')
+# A cutoff at or above Nyquist for a learnt rate is lowered to this fraction of it
+MAX_CUTOFF = 0.9
+
+
+def butter_lowpass(order, cutoff, rate):
+    """(sections, 6) array of [b0, b1, b2, 1, a1, a2] rows, unity gain at DC
+
+    Analog Butterworth poles, prewarped and mapped by the bilinear transform;
+    every zero lands on z = -1. Conjugate poles share a section; an odd order
+    ends with a first-order one (b2 = a2 = 0).
+    """
+    if not 0 < cutoff < rate / 2:
+        raise ValueError(f"cutoff must be between 0 and {rate / 2:g} Hz: {cutoff}")
+    if order < 1:
+        raise ValueError(f"order must be at least 1: {order}")
+    fs2 = 2.0 * rate
+    warped = fs2 * np.tan(np.pi * cutoff / rate)
+    # Upper-half-plane analog poles (the real one last for odd orders)
+    k = np.arange(order // 2)
+    poles = warped * np.exp(1j * np.pi * (2 * k + order + 1) / (2 * order))
+    z = (fs2 + poles) / (fs2 - poles)
+
+    sos = []
+    for p in z:
+        sos.append([1.0, 2.0, 1.0, 1.0, -2 * p.real, abs(p) ** 2])
+    if order % 2:
+        p = (fs2 - warped) / (fs2 + warped)
+        sos.append([1.0, 1.0, 0.0, 1.0, -p, 0.0])
+    sos = np.array(sos)
+    # Scale each section's numerator to unity DC gain
+    sos[:, :3] *= (sos[:, 3:].sum(axis=1) / sos[:, :3].sum(axis=1))[:, None]
+    return sos
+
+
+class _Section:
+    """One second-order section as a state-space system, solved a block at a time
+
+    State s (transposed direct form II) evolves as s' = A s + B x and
+    y = C s + D x, with C = [1, 0]. Over a block of L samples that is
+    y = T x + O s and s_L = A^L s + G x, with T the lower-triangular Toeplitz
+    matrix of the impulse response: matrix products across all channels
+    instead of a Python loop over samples. The matrices are built once for
+    blocks of up to BLOCK samples.
+    """
+
+    def __init__(self, row, block):
+        b0, b1, b2, _, a1, a2 = row
+        a = np.array([[-a1, 1.0], [-a2, 0.0]])
+        b = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        self.a = a
+        self.b = b
+
+        powers = np.empty((block + 1, 2, 2))
+        powers[0] = np.eye(2)
+        for n in range(block):
+            powers[n + 1] = a @ powers[n]
+        self.powers = powers
+        # Free response of y to the state, and the state's response to x
+        self.free = powers[:block, 0, :]
+        forced = powers[:block] @ b
+        impulse = np.concatenate(([b0], forced[:block - 1, 0]))
+        lag = np.arange(block)[:, None] - np.arange(block)
+        self.toeplitz = np.where(lag >= 0, impulse[np.maximum(lag, 0)], 0.0)
+        # Row j is A^(L-1-j) B for a block of L: reversed so a block takes the tail
+        self.forced = forced[::-1]
+
+    def steady(self, x):
+        """State for a constant input x (any shape), so filtering starts without a step"""
+        return np.linalg.solve(np.eye(2) - self.a, self.b)[:, None] * x
+
+    def run(self, x, state):
+        """Filter block x (L, channels) from state (2, channels); returns y, new state"""
+        n = len(x)
+        y = self.toeplitz[:n, :n] @ x + self.free[:n] @ state
+        state = self.powers[n] @ state + self.forced[len(self.forced) - n:].T @ x
+        return y, state
+
+
+class LowPassFilter:
+    """Butterworth low-pass over F1-F4, COPx and COPy, batch by batch
+
+    filter() returns a filtered copy of each batch; state carries over, so
+    a stream filtered in batches of any size matches one filtered whole.
+    The state starts at the first sample's steady state rather than zero.
+    rate (Hz) is learnt from the median TIME step of the first samples if
+    not given; until then batches pass through unfiltered. A cutoff the
+    learnt rate cannot carry is lowered to MAX_CUTOFF of Nyquist, once,
+    with a warning.
+    """
+
+    BLOCK = 128
+    LEARN_SAMPLES = 64
+
+    def __init__(self, cutoff=10.0, rate=None, order=4):
+        if not cutoff > 0:
+            raise ValueError(f"cutoff must be above 0 Hz: {cutoff}")
+        if order < 1:
+            raise ValueError(f"order must be at least 1: {order}")
+        self.cutoff = cutoff
+        self.order = order
+        self.rate = None
+        self.sections = None
+        self.state = None
+        self.learning = []
+        if rate is not None:
+            self._design(rate)
+
+    def _design(self, rate):
+        self.rate = float(rate)
+        self.sos = butter_lowpass(self.order, self.cutoff, self.rate)
+        self.sections = [_Section(row, self.BLOCK) for row in self.sos]
+
+    def filter(self, samples):
+        if not len(samples):
+            return samples
+        if self.sections is None:
+            self.learning.extend(np.diff(samples['time']).tolist())
+            steps = np.array(self.learning)
+            steps = steps[steps > 0]
+            if len(steps) < self.LEARN_SAMPLES:
+                return samples
+            self.learning = []
+            rate = 1000.0 / float(np.median(steps))
+            if self.cutoff >= rate / 2:
+                cutoff = MAX_CUTOFF * rate / 2
+                print(f"Low-pass: {self.cutoff:g} Hz is above Nyquist for {rate:.0f} Hz samples, "
+                      f"using {cutoff:.3g} Hz", file=sys.stderr)
+                self.cutoff = cutoff
+            self._design(rate)
+
+        x = np.column_stack([samples[name] for name in CHANNELS])
+        if self.state is None:
+            self.state = [section.steady(x[0]) for section in self.sections]
+
+        for i, section in enumerate(self.sections):
+            state = self.state[i]
+            for start in range(0, len(x), self.BLOCK):
+                x[start:start + self.BLOCK], state = section.run(x[start:start + self.BLOCK],
+                                                                 state)
+            self.state[i] = state
+
+        out = samples.copy()
+        for j, name in enumerate(CHANNELS):
+            out[name] = x[:, j]
+        return out
+
+    def reset(self):
+        """Forget the state: the next batch starts from its own steady state"""
+        self.state = None
+
+    def __str__(self):
+        return f"{self.order}th-order {self.cutoff:g} Hz low-pass"
@@ -0,0 +1,315 @@
+"""
+Balance Board Stream Framing - bytes in, complete lines or binary frames out
+Shared by the receiver and the visualizer
+
+Text protocol: TIME,F1,F2,F3,F4,COPx,COPy lines (~50 bytes per sample)
+Binary protocol: 38-byte little-endian frames (~300 samples/s at 115200 baud)
+    sync   u16  0x5AA5 (bytes A5 5A)
+    seq    u16  increments by one per frame, wraps at 65536
+    time   f64  device TIME (ms, fractional above 1 kHz, as in the text lines)
+    f1..f4, copx, copy  f32
+    crc    u16  CRC-16/CCITT-FALSE over seq..copy
+"""
+
+import numpy as np
+
+from balanceboardparser import FIELDS, ParseStats, empty_samples, parse_lines
+
+# Firmware lines are ~50 bytes; anything far longer is noise or a lost newline
+MAX_LINE = 512
+
+SYNC = b'\xa5\x5a'
+FRAME_DTYPE = np.dtype([('sync', '<u2'), ('seq', '<u2'), ('time', '<f8')] +
+                       [(name, '<f4') for name in FIELDS[1:]] + [('crc', '<u2')])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+_SYNC_WORD = int.from_bytes(SYNC, 'little')
+# A frame up to this many behind the highest seq is late (and fills its gap);
+# further back, the device restarted
+REORDER_FRAMES = 32
+# Auto-detection gives up on binary after this much undecided input
+_DETECT_LIMIT = 4096
+
+
+def _crc_tables():
+    """Byte-wise table, plus a 16-bit table that consumes two bytes per step"""
+    table = np.zeros(256, np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+
+    word = np.arange(65536, dtype=np.uint16)
+    crc = table[word >> 8]
+    table16 = (crc << 8) ^ table[(crc >> 8) ^ (word & 0xFF)]
+    return table, table16
+
+
+_CRC_TABLE, _CRC_TABLE16 = _crc_tables()
+
+
+def crc16(rows):
+    """CRC-16/CCITT-FALSE of each row of an (n, m) uint8 array, all rows at once"""
+    crc = np.full(len(rows), 0xFFFF, np.uint16)
+    pairs = rows.shape[1] // 2
+    words = (rows[:, 0:2 * pairs:2].astype(np.uint16) << 8) | rows[:, 1:2 * pairs:2]
+    for k in range(pairs):
+        crc = _CRC_TABLE16[crc ^ words[:, k]]
+    if rows.shape[1] % 2:
+        crc = (crc << 8) ^ _CRC_TABLE[(crc >> 8) ^ rows[:, -1]]
+    return crc
+
+
+def _frame_crc(frames):
+    rows = frames.view(np.uint8).reshape(len(frames), FRAME_SIZE)
+    return crc16(rows[:, 2:FRAME_SIZE - 2])
+
+
+def encode_frames(samples, start_seq=0):
+    """Pack SAMPLE_DTYPE samples into binary frames (what the firmware sends)"""
+    frames = np.zeros(len(samples), FRAME_DTYPE)
+    frames['sync'] = _SYNC_WORD
+    frames['seq'] = (start_seq + np.arange(len(samples))) & 0xFFFF
+    for name in FIELDS:
+        frames[name] = samples[name]
+    frames['crc'] = _frame_crc(frames)
+    return frames.tobytes()
+
+
+def frames_to_samples(frames):
+    samples = empty_samples(len(frames))
+    for name in FIELDS:
+        samples[name] = frames[name]
+    return samples
+
+
+class LineFramer:
+    """Split a byte stream into lines, carrying partial lines across reads"""
+
+    def __init__(self, max_line=MAX_LINE):
+        self.max_line = max_line
+        self.partial = bytearray()
+        # True while skipping the rest of an oversize line up to the next newline
+        self.discarding = False
+        self.oversize = 0
+
+    def feed(self, data):
+        """Return the complete lines in data (newline removed, other whitespace kept)"""
+        if b'\n' not in data:
+            # Small reads mid-line: just accumulate
+            if not self.discarding:
+                self.partial += data
+                if len(self.partial) > self.max_line:
+                    self.oversize += 1
+                    self.discarding = True
+                    self.partial.clear()
+            return []
+
+        if self.partial:
+            # partial never exceeds max_line, so this copy is bounded
+            data = bytes(self.partial) + data
+            self.partial.clear()
+
+        # One pass over the chunk; the last piece is the unterminated remainder
+        lines = data.split(b'\n')
+        rest = lines.pop()
+
+        if self.discarding and lines:
+            # First piece is the tail of a line already counted as oversize
+            del lines[0]
+            self.discarding = False
+
+        if lines and max(map(len, lines)) > self.max_line:
+            self.oversize += sum(1 for line in lines if len(line) > self.max_line)
+            lines = [line for line in lines if len(line) <= self.max_line]
+
+        if self.discarding:
+            pass
+        elif len(rest) > self.max_line:
+            # No newline in sight: drop it rather than grow without bound
+            self.oversize += 1
+            self.discarding = True
+        else:
+            self.partial += rest
+
+        return lines
+
+
+class FrameDecoder:
+    """Decode binary frames in bulk, resynchronising on the sync word after corruption
+
+    Frames skipped by seq count as lost; one that turns up late (at most
+    REORDER_FRAMES behind) is taken off again. A step further back is a
+    device restart (resets), after which counting starts over.
+    """
+
+    def __init__(self):
+        self.partial = b''
+        self.bad_crc = 0
+        self.skipped_bytes = 0
+        # Frames missing according to the sequence number, and device restarts
+        self.lost_frames = 0
+        self.resets = 0
+        # Highest seq so far, and the missing seqs just below it
+        self.last_seq = None
+        self.holes = ()
+
+    def feed(self, data):
+        """Return the SAMPLE_DTYPE samples of every complete, valid frame in data"""
+        buf = self.partial + data
+        good = []
+        pos = 0
+
+        while len(buf) - pos >= FRAME_SIZE:
+            if buf[pos:pos + 2] != SYNC:
+                nxt = buf.find(SYNC, pos + 1)
+                nxt = len(buf) - 1 if nxt < 0 else nxt
+                self.skipped_bytes += nxt - pos
+                pos = nxt
+                continue
+
+            # Take the run of frames that stay aligned from here (normally all of them)
+            count = (len(buf) - pos) // FRAME_SIZE
+            frames = np.frombuffer(buf, FRAME_DTYPE, count, pos)
+            misaligned = np.flatnonzero(frames['sync'] != _SYNC_WORD)
+            if len(misaligned):
+                frames = frames[:misaligned[0]]
+            bad = np.flatnonzero(_frame_crc(frames) != frames['crc'])
+            if len(bad):
+                # Keep what precedes the bad frame, then search again one byte past it
+                frames = frames[:bad[0]]
+                self.bad_crc += 1
+            good.append(frames)
+            pos += len(frames) * FRAME_SIZE
+            if len(bad):
+                self.skipped_bytes += 1
+                pos += 1
+
+        self.partial = buf[pos:]
+        if not good:
+            return empty_samples()
+        frames = np.concatenate(good) if len(good) > 1 else good[0]
+        self._count_lost(frames['seq'])
+        return frames_to_samples(frames)
+
+    def _count_lost(self, seq):
+        if len(seq) == 0:
+            return
+        # uint16 differences wrap, so 65535 -> 0 is a step of 1 too
+        if self.last_seq is not None and (int(seq[0]) - self.last_seq) & 0xFFFF == 1 \
+                and (np.diff(seq) == 1).all():
+            # Usual case: every frame follows the last
+            self.last_seq = int(seq[-1])
+            if self.holes:
+                self.holes = self._recent(self.holes)
+            return
+        for value in seq.tolist():
+            self._step(value)
+
+    def _step(self, seq):
+        """One frame, out of the usual order: a gap, a late frame, a repeat or a restart"""
+        if self.last_seq is None:
+            self.last_seq = seq
+            return
+        # Signed 16-bit step from the highest seq so far
+        step = (seq - self.last_seq + 0x8000) % 0x10000 - 0x8000
+        if step > 0:
+            self.lost_frames += step - 1
+            self.last_seq = seq
+            # Remember the newest holes, so a frame that turns up late can fill one
+            self.holes = self._recent(self.holes) + tuple(
+                (seq - k) & 0xFFFF for k in range(1, min(step, REORDER_FRAMES + 1)))
+        elif step < -REORDER_FRAMES:
+            # Too far back to be late: the device restarted, count from here
+            self.resets += 1
+            self.last_seq = seq
+            self.holes = ()
+        elif seq in self.holes:
+            self.lost_frames -= 1
+            self.holes = tuple(h for h in self.holes if h != seq)
+
+    def _recent(self, holes):
+        return tuple(h for h in holes if (self.last_seq - h) & 0xFFFF <= REORDER_FRAMES)
+
+
+class StreamDecoder:
+    """Text lines and/or binary frames from one byte stream
+
+    protocol is 'text', 'binary' or 'auto'. In auto mode, text lines are passed
+    through (the firmware banner) until either a CRC-valid frame or a parseable
+    sample line decides the protocol for the rest of the stream.
+    """
+
+    def __init__(self, protocol='auto', max_line=MAX_LINE):
+        if protocol not in ('auto', 'text', 'binary'):
+            raise ValueError(f"Unknown protocol: {protocol}")
+        self.protocol = protocol
+        self.framer = LineFramer(max_line)
+        self.frames = FrameDecoder()
+        self.pending = b''
+        # Pass to parse_lines() along with the lines from feed(); oversize lines
+        # dropped by the framer are counted here too
+        self.stats = ParseStats()
+
+    def feed(self, data):
+        """Return (lines, samples): text lines as bytes, and samples decoded from frames"""
+        if self.protocol == 'binary':
+            return [], self.frames.feed(data)
+        if self.protocol == 'text':
+            result = self.framer.feed(data), empty_samples()
+        else:
+            result = self._detect(data)
+        oversize = self.framer.oversize - self.stats.counts['oversize']
+        if oversize:
+            self.stats.reject('oversize', n=oversize)
+        return result
+
+    def decode(self, data):
+        """All samples in data, whichever protocol carried them"""
+        return self.merge(*self.feed(data))
+
+    def merge(self, lines, samples):
+        """Parse lines from feed() and join them with the samples decoded from frames"""
+        parsed = parse_lines(lines, self.stats)
+        if len(samples) == 0:
+            return parsed
+        return np.concatenate((parsed, samples)) if len(parsed) else samples
+
+    def counters(self):
+        """Parse and frame error counters as a dict"""
+        return {**self.stats.as_dict(), 'bad_crc': self.frames.bad_crc,
+                'skipped_bytes': self.frames.skipped_bytes,
+                'lost_frames': self.frames.lost_frames, 'seq_resets': self.frames.resets}
+
+    def _detect(self, data):
+        buf = self.pending + data
+        self.pending = b''
+
+        pos = _find_valid_frame(buf)
+        if pos >= 0:
+            self.protocol = 'binary'
+            lines = self.framer.feed(buf[:pos] + b'\n') if pos else []
+            return lines, self.frames.feed(buf[pos:])
+
+        # Text never contains 0xA5, so lines ending before the first one are safe to emit
+        marker = buf.find(SYNC[:1])
+        end = buf.rfind(b'\n', 0, len(buf) if marker < 0 else marker)
+        lines = self.framer.feed(buf[:end + 1]) if end >= 0 else []
+        self.pending = buf[end + 1:]
+
+        if len(parse_lines(lines)) or len(self.pending) > _DETECT_LIMIT:
+            self.protocol = 'text'
+            lines += self.framer.feed(self.pending)
+            self.pending = b''
+        return lines, empty_samples()
+
+
+def _find_valid_frame(buf):
+    """Offset of the first CRC-valid frame in buf, or -1"""
+    pos = buf.find(SYNC)
+    while 0 <= pos <= len(buf) - FRAME_SIZE:
+        frame = np.frombuffer(buf, FRAME_DTYPE, 1, pos)
+        if _frame_crc(frame)[0] == frame['crc'][0]:
+            return pos
+        pos = buf.find(SYNC, pos + 1)
+    return -1
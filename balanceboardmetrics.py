@@ -0,0 +1,321 @@
+"""
+Balance Board Sway Metrics - posturography on the COP stream, updated per batch
+or over a whole recording at once
+COPx is medio-lateral (ML), COPy antero-posterior (AP), both in cm; TIME in ms
+Left/right and front/back load come from F1-F4 as laid out in balanceboardcop
+"""
+
+import argparse
+
+import numpy as np
+
+from balanceboardrecorder import read_session
+
+# Confidence level of the sway ellipse
+ELLIPSE_LEVEL = 0.95
+# Sums kept per sample: x, y, xx, yy, xy and the step from the previous sample
+_X, _Y, _XX, _YY, _XY, _STEP = range(6)
+
+
+def ellipse_area(n, var_ml, var_ap, cov, level=ELLIPSE_LEVEL):
+    """Area of the confidence ellipse of n COP points (Prieto et al. 1996), cm^2
+
+    2 pi F sqrt(var_ml var_ap - cov^2), with F the level quantile of the F
+    distribution with (2, n - 2) degrees of freedom, which has a closed form.
+    """
+    if n < 3:
+        return 0.0
+    m = n - 2
+    f = m / 2 * ((1 - level) ** (-2 / m) - 1)
+    return 2 * np.pi * f * np.sqrt(max(var_ml * var_ap - cov * cov, 0.0))
+
+
+def sway_metrics(n, sums, duration, range_ml, range_ap):
+    """Metrics dict from per-window sums (see _X.._STEP, COP relative to any fixed point)"""
+    if n == 0:
+        return {'samples': 0, 'duration': 0.0, 'path_length': 0.0, 'mean_velocity': 0.0,
+                'rms': 0.0, 'rms_ml': 0.0, 'rms_ap': 0.0, 'range_ml': 0.0, 'range_ap': 0.0,
+                'ellipse_area': 0.0}
+    mean_x, mean_y = sums[_X] / n, sums[_Y] / n
+    var_ml = max(sums[_XX] / n - mean_x * mean_x, 0.0)
+    var_ap = max(sums[_YY] / n - mean_y * mean_y, 0.0)
+    cov = sums[_XY] / n - mean_x * mean_y
+    path = sums[_STEP]
+    return {
+        'samples': n,
+        'duration': duration,
+        'path_length': path,
+        'mean_velocity': path / duration if duration > 0 else 0.0,
+        'rms': np.sqrt(var_ml + var_ap),
+        'rms_ml': np.sqrt(var_ml),
+        'rms_ap': np.sqrt(var_ap),
+        'range_ml': range_ml,
+        'range_ap': range_ap,
+        'ellipse_area': ellipse_area(n, var_ml, var_ap, cov),
+    }
+
+
+def _terms(x, y, prev):
+    """(n, 6) per-sample terms; prev is the (x, y) before x[0], or None"""
+    terms = np.empty((len(x), 6))
+    terms[:, _X] = x
+    terms[:, _Y] = y
+    terms[:, _XX] = x * x
+    terms[:, _YY] = y * y
+    terms[:, _XY] = x * y
+    px = np.concatenate(([x[0] if prev is None else prev[0]], x[:-1]))
+    py = np.concatenate(([y[0] if prev is None else prev[1]], y[:-1]))
+    terms[:, _STEP] = np.hypot(x - px, y - py)
+    return terms
+
+
+def session_metrics(samples):
+    """Sway and force metrics of a whole recording in one vectorised pass
+
+    The sway keys match SwayMetrics' session results; on top come the mean
+    COP and the force distribution (per sensor, left/right, front/back) as
+    percentages of the total load over the recording.
+    """
+    n = len(samples)
+    if n == 0:
+        return sway_metrics(0, np.zeros(6), 0.0, 0.0, 0.0)
+
+    # Same reference point as the streaming engine, so the two agree to rounding
+    x = samples['copx'] - samples['copx'][0]
+    y = samples['copy'] - samples['copy'][0]
+    sums = np.empty(6)
+    sums[_X], sums[_Y] = x.sum(), y.sum()
+    sums[_XX], sums[_YY], sums[_XY] = np.dot(x, x), np.dot(y, y), np.dot(x, y)
+    sums[_STEP] = np.hypot(np.diff(x), np.diff(y)).sum()
+    duration = (samples['time'][-1] - samples['time'][0]) / 1000.0
+    metrics = sway_metrics(n, sums, duration, float(np.ptp(x)), float(np.ptp(y)))
+
+    metrics['mean_ml'] = float(samples['copx'].mean())
+    metrics['mean_ap'] = float(samples['copy'].mean())
+    forces = {name: float(samples[name].sum()) for name in ('f1', 'f2', 'f3', 'f4')}
+    total = sum(forces.values())
+    metrics['mean_load'] = total / n
+    share = (lambda force: 100.0 * force / total) if total else (lambda force: 0.0)
+    for name, force in forces.items():
+        metrics[f'{name}_pct'] = share(force)
+    metrics['left_pct'] = share(forces['f2'] + forces['f3'])
+    metrics['right_pct'] = share(forces['f1'] + forces['f4'])
+    metrics['front_pct'] = share(forces['f1'] + forces['f2'])
+    metrics['back_pct'] = share(forces['f3'] + forces['f4'])
+    return metrics
+
+
+class SwayAccumulator:
+    """Whole-session sway metrics: running sums, O(1) per sample"""
+
+    def __init__(self):
+        # COP is taken relative to the first point, so the sums of squares stay
+        # small and the variances don't lose precision over long sessions
+        self.origin = None
+        self.n = 0
+        self.sums = np.zeros(6)
+        self.first_time = None
+        self.last_time = None
+        self.prev = None
+        self.low = np.full(2, np.inf)
+        self.high = np.full(2, -np.inf)
+
+    def update(self, samples):
+        if not len(samples):
+            return
+        if self.origin is None:
+            self.origin = (float(samples['copx'][0]), float(samples['copy'][0]))
+            self.first_time = float(samples['time'][0])
+        x = samples['copx'] - self.origin[0]
+        y = samples['copy'] - self.origin[1]
+
+        self.sums += _terms(x, y, self.prev).sum(axis=0)
+        self.n += len(x)
+        self.prev = (float(x[-1]), float(y[-1]))
+        self.last_time = float(samples['time'][-1])
+        self.low = np.minimum(self.low, (x.min(), y.min()))
+        self.high = np.maximum(self.high, (x.max(), y.max()))
+
+    def result(self):
+        if self.n == 0:
+            return sway_metrics(0, self.sums, 0.0, 0.0, 0.0)
+        extent = self.high - self.low
+        return sway_metrics(self.n, self.sums, (self.last_time - self.first_time) / 1000.0,
+                            float(extent[0]), float(extent[1]))
+
+
+class SlidingSway:
+    """Sway metrics over the last `seconds` of device TIME
+
+    Samples are kept in a ring with prefix sums, so window sums are one
+    subtraction. Ranges come from per-block minima/maxima plus the partial
+    blocks at the window edges. max_rate (Hz) sizes the ring; at higher rates
+    the window holds fewer seconds (capacity - 1 samples: the prefix sums of
+    the sample before the window must still be in the ring).
+    """
+
+    BLOCK = 256
+
+    def __init__(self, seconds, max_rate=2000.0):
+        self.seconds = seconds
+        blocks = int(np.ceil(seconds * max_rate / self.BLOCK)) + 2
+        self.capacity = blocks * self.BLOCK
+        self.time = np.zeros(self.capacity)
+        self.xy = np.zeros((self.capacity, 2))
+        # prefix[i % capacity] = sums of the terms of samples 0..i
+        self.prefix = np.zeros((self.capacity, 6))
+        self.block_low = np.zeros((blocks, 2))
+        self.block_high = np.zeros((blocks, 2))
+        self.written = 0
+        self.start = 0
+        self.origin = None
+        self.prev = None
+        self.total = np.zeros(6)
+
+    def update(self, samples):
+        n = len(samples)
+        if not n:
+            return
+        if self.origin is None:
+            self.origin = (float(samples['copx'][0]), float(samples['copy'][0]))
+        if n > self.capacity:
+            # Older samples of this batch would be overwritten at once; only the
+            # step into the kept part is still needed
+            head = samples[:n - self.capacity]
+            self.prev = (float(head['copx'][-1]) - self.origin[0],
+                         float(head['copy'][-1]) - self.origin[1])
+            self.written += len(head)
+            samples = samples[n - self.capacity:]
+            n = len(samples)
+
+        x = samples['copx'] - self.origin[0]
+        y = samples['copy'] - self.origin[1]
+        prefix = self.total + np.cumsum(_terms(x, y, self.prev), axis=0)
+        self.total = prefix[-1]
+        self.prev = (float(x[-1]), float(y[-1]))
+
+        slots = (self.written + np.arange(n)) % self.capacity
+        self.time[slots] = samples['time']
+        self.xy[slots, 0] = x
+        self.xy[slots, 1] = y
+        self.prefix[slots] = prefix
+
+        # Min/max of every block this batch completed
+        first_block = self.written // self.BLOCK
+        self.written += n
+        for block in range(first_block, self.written // self.BLOCK):
+            at = (block * self.BLOCK) % self.capacity
+            values = self.xy[at:at + self.BLOCK]
+            self.block_low[block % len(self.block_low)] = values.min(axis=0)
+            self.block_high[block % len(self.block_high)] = values.max(axis=0)
+
+        # Move the window start past samples older than `seconds`, and past the
+        # oldest kept sample, whose slot holds the prefix the window sums start from
+        oldest = max(self.start, self.written - self.capacity + 1)
+        cutoff = float(samples['time'][-1]) - self.seconds * 1000.0
+        self.start = oldest + self._count_before(oldest, cutoff)
+
+    def _count_before(self, begin, cutoff):
+        """Samples from global index begin on with TIME <= cutoff (TIME ascending)"""
+        end = self.written
+        a, b = begin % self.capacity, end % self.capacity
+        if begin == end:
+            return 0
+        if a < b:
+            return int(np.searchsorted(self.time[a:b], cutoff, 'right'))
+        first = np.searchsorted(self.time[a:], cutoff, 'right')
+        if first < self.capacity - a:
+            return int(first)
+        return int(first + np.searchsorted(self.time[:b], cutoff, 'right'))
+
+    def result(self):
+        start, end = self.start, self.written
+        n = end - start
+        if n <= 0:
+            return sway_metrics(0, self.total, 0.0, 0.0, 0.0)
+
+        last = self.prefix[(end - 1) % self.capacity]
+        before = self.prefix[(start - 1) % self.capacity] if start > 0 else np.zeros(6)
+        sums = last - before
+        # The step into the window's first sample comes from outside it
+        sums[_STEP] -= self.prefix[start % self.capacity, _STEP] - before[_STEP]
+        duration = (self.time[(end - 1) % self.capacity] - self.time[start % self.capacity]) / 1000.0
+
+        low, high = self._extent(start, end)
+        return sway_metrics(n, sums, duration, float(high[0] - low[0]), float(high[1] - low[1]))
+
+    def _extent(self, start, end):
+        """Per-axis min and max of samples start..end-1"""
+        first_full = -(-start // self.BLOCK)
+        last_full = end // self.BLOCK
+        parts_low, parts_high = [], []
+        if first_full < last_full:
+            blocks = np.arange(first_full, last_full) % len(self.block_low)
+            parts_low.append(self.block_low[blocks].min(axis=0))
+            parts_high.append(self.block_high[blocks].max(axis=0))
+            edges = [(start, first_full * self.BLOCK), (last_full * self.BLOCK, end)]
+        else:
+            edges = [(start, end)]
+        for a, b in edges:
+            if a < b:
+                values = self.xy[np.arange(a, b) % self.capacity]
+                parts_low.append(values.min(axis=0))
+                parts_high.append(values.max(axis=0))
+        return np.min(parts_low, axis=0), np.max(parts_high, axis=0)
+
+
+class SwayMetrics:
+    """Whole-session and sliding-window sway metrics from one stream of batches"""
+
+    def __init__(self, windows=(10.0,), max_rate=2000.0):
+        self.session = SwayAccumulator()
+        self.windows = {seconds: SlidingSway(seconds, max_rate) for seconds in windows}
+
+    def update(self, samples):
+        self.session.update(samples)
+        for window in self.windows.values():
+            window.update(samples)
+
+    def results(self):
+        """{'session': metrics, seconds: metrics, ...}"""
+        results = {'session': self.session.result()}
+        for seconds, window in self.windows.items():
+            results[seconds] = window.result()
+        return results
+
+    def text(self):
+        """Short multi-line summary for a text box"""
+        lines = []
+        for name, m in self.results().items():
+            label = 'Session' if name == 'session' else f'Last {name:g} s'
+            lines.append(f"{label}: path {m['path_length']:.1f} cm, "
+                         f"{m['mean_velocity']:.2f} cm/s, RMS {m['rms']:.2f} cm")
+            lines.append(f"  range {m['range_ml']:.1f} x {m['range_ap']:.1f} cm, "
+                         f"ellipse {m['ellipse_area']:.1f} cm²")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sway and force metrics of recorded sessions")
+    parser.add_argument('sessions', nargs='+')
+    args = parser.parse_args()
+
+    for path in args.sessions:
+        _, samples = read_session(path)
+        m = session_metrics(samples)
+        print(f"{path}: {m['samples']} samples, {m['duration']:.1f} s")
+        if not m['samples']:
+            continue
+        print(f"  path {m['path_length']:.1f} cm, mean velocity {m['mean_velocity']:.2f} cm/s")
+        print(f"  RMS {m['rms']:.2f} cm (ML {m['rms_ml']:.2f}, AP {m['rms_ap']:.2f}), "
+              f"range {m['range_ml']:.1f} x {m['range_ap']:.1f} cm, "
+              f"ellipse {m['ellipse_area']:.1f} cm²")
+        print(f"  mean COP ({m['mean_ml']:.2f}, {m['mean_ap']:.2f}) cm, "
+              f"mean load {m['mean_load']:.1f} Kg")
+        print(f"  left/right {m['left_pct']:.1f}/{m['right_pct']:.1f}%, "
+              f"front/back {m['front_pct']:.1f}/{m['back_pct']:.1f}%, "
+              f"F1-F4 {m['f1_pct']:.1f}/{m['f2_pct']:.1f}/{m['f3_pct']:.1f}/{m['f4_pct']:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
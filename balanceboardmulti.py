@@ -0,0 +1,164 @@
+"""
+Balance Board Multi-Board Receiver - several boards, one process, one selector loop
+Output format: BOARD,TIME,F1,F2,F3,F4,COPx,COPy
+"""
+
+import argparse
+import selectors
+import sys
+import time
+
+import serial
+
+from balanceboardcop import CopCheck, add_geometry_args, geometry_from_args
+from balanceboardframing import StreamDecoder
+from balanceboardparser import format_samples
+from balanceboardsources import open_source
+from balanceboardtiming import ClockSync, TimeTracker
+
+
+class Board:
+    """One source and its decoder"""
+
+    def __init__(self, name, port, baudrate, protocol, cop='device', geometry=None):
+        self.name = name
+        self.source = open_source(port, baudrate, 0)
+        self.decoder = StreamDecoder(protocol)
+        self.decoder.stats.reporter.name = f"Board {name}"
+        self.timing = TimeTracker(name=f"Board {name}")
+        # Puts every board on the host clock: self.clock.to_host(samples['time'])
+        self.clock = ClockSync()
+        # Host COP from F1-F4: checks the board's own, fills in forces-only lines
+        self.cop = CopCheck(geometry, cop, name=f"Board {name}")
+        self.samples = 0
+        self.error = None
+
+
+class MultiBoardReceiver:
+    """Read N boards from a single selector loop; every batch is tagged with its board
+
+    Ports can be any source spec (see balanceboardsources). If any source has no
+    fileno() (Windows serial, file replay) the boards are scanned instead,
+    sleeping max_latency whenever none had data.
+    """
+
+    def __init__(self, ports, baudrate=115200, max_latency=0.05, protocol='auto',
+                 on_samples=None, names=None, cop='device', board=None):
+        # cop and board (a BoardGeometry) apply to every board
+        names = names or list(ports)
+        self.names = list(names)
+        self.boards = [Board(name, port, baudrate, protocol, cop, board)
+                       for name, port in zip(names, ports)]
+        self.max_latency = max_latency
+        # Called as on_samples(board_name, samples) for each batch
+        self.on_samples = on_samples
+        self.running = False
+
+        self.selector = None
+        if all(board.source.fileno() is not None for board in self.boards):
+            self.selector = selectors.DefaultSelector()
+            for board in self.boards:
+                self.selector.register(board.source.fileno(), selectors.EVENT_READ, board)
+
+        for board in self.boards:
+            print(f"Connected board {board.name}: {board.source}")
+        print()
+
+    def poll(self, timeout=None):
+        """Wait up to timeout (default max_latency) for data; return [(board, samples)]"""
+        if timeout is None:
+            timeout = self.max_latency
+
+        if self.selector is not None:
+            ready = [key.data for key, _ in self.selector.select(timeout)]
+        else:
+            ready = [board for board in self.boards if board.error is None]
+
+        batches = []
+        for board in ready:
+            try:
+                chunk = board.source.read_nowait()
+            except (OSError, EOFError) as e:
+                self._drop(board, e)
+                continue
+            if chunk:
+                stamp = time.monotonic_ns()
+                samples = board.cop.apply(board.decoder.decode(chunk))
+                if len(samples):
+                    board.samples += len(samples)
+                    board.timing.update(samples)
+                    board.clock.observe(stamp, samples['time'][-1])
+                    batches.append((board.name, samples))
+
+        if self.selector is None and not batches:
+            time.sleep(timeout)
+        return batches
+
+    def host_times(self, name, samples):
+        """Host-aligned time.monotonic_ns() of a batch from board name (int64)"""
+        return self.boards[self.names.index(name)].clock.to_host(samples['time'])
+
+    def start(self):
+        """Read all boards until stop() or every board has gone; print tagged CSV
+        unless on_samples is set"""
+        self.running = True
+        while self.running and any(board.error is None for board in self.boards):
+            try:
+                for name, samples in self.poll():
+                    if self.on_samples is not None:
+                        self.on_samples(name, samples)
+                    else:
+                        tag = name.encode()
+                        lines = [tag + b',' + line for line in format_samples(samples)]
+                        sys.stdout.buffer.write(b'\n'.join(lines) + b'\n')
+                        sys.stdout.buffer.flush()
+            except KeyboardInterrupt:
+                break
+
+    def stop(self):
+        """Make start() return after the current poll"""
+        self.running = False
+
+    def close(self):
+        for board in self.boards:
+            board.source.close()
+        if self.selector is not None:
+            self.selector.close()
+        print("\nSerial connections closed")
+        for board in self.boards:
+            status = f" ({board.error})" if board.error is not None else ""
+            print(f"{board.name}: {board.samples} samples, "
+                  f"{board.decoder.stats.rejected} rejected lines{status}")
+            print(f"{board.name} TIME: {board.timing.summary()}")
+            print(f"{board.name} COP: {board.cop.summary()}")
+
+    def _drop(self, board, error):
+        # A board that went away must not take the others down with it
+        board.error = error
+        if self.selector is not None:
+            self.selector.unregister(board.source.fileno())
+        print(f"Board {board.name} disconnected: {error}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Balance board multi-board receiver")
+    parser.add_argument('ports', nargs='+')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    add_geometry_args(parser)
+    args = parser.parse_args()
+
+    receiver = None
+    try:
+        board = geometry_from_args(args)
+        receiver = MultiBoardReceiver(args.ports, args.baudrate, cop=args.cop, board=board)
+        receiver.start()
+    except (serial.SerialException, OSError) as e:
+        print("Error: Could not open serial ports")
+        print(f"Details: {e}")
+    finally:
+        if receiver is not None:
+            receiver.close()
+
+
+if __name__ == "__main__":
+    main()
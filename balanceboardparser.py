@@ -0,0 +1,217 @@
+"""
+Balance Board Sample Parser - CSV lines to NumPy arrays
+Data format: TIME,F1,F2,F3,F4,COPx,COPy
+Forces-only firmware sends TIME,F1,F2,F3,F4; COPx and COPy are then NaN
+until the host fills them in (see balanceboardcop)
+"""
+
+from array import array
+
+import numpy as np
+
+from balanceboardreport import Reporter
+
+FIELDS = ('time', 'f1', 'f2', 'f3', 'f4', 'copx', 'copy')
+SAMPLE_DTYPE = np.dtype([(name, np.float64) for name in FIELDS])
+# Fields of a forces-only line
+FORCE_FIELDS = FIELDS[:5]
+
+# Firmware banner and status messages - expected, counted but never reported
+STATUS_PREFIXES = (b"Setup", b"Taring", b"Format", b"Force", b"Calculating")
+
+# Below this many lines a batch is parsed line by line: the vectorised path's
+# fixed cost (joins, frombuffer, reduceat) only pays off on larger batches
+SMALL_BATCH = 32
+
+_NEWLINE = ord('\n')
+_COMMA = ord(',')
+
+
+def empty_samples(n=0):
+    """Uninitialised SAMPLE_DTYPE array of length n"""
+    return np.empty(n, SAMPLE_DTYPE)
+
+
+def as_matrix(samples):
+    """(n, 7) float64 view of a SAMPLE_DTYPE array (copied only if not contiguous)"""
+    return np.ascontiguousarray(samples).view(np.float64).reshape(-1, len(FIELDS))
+
+
+class ParseStats:
+    """Counts of samples parsed and lines rejected, by cause
+
+    'field_count'  wrong number of fields
+    'bad_float'    right field count, but a field is not a number
+    'decode_error' line is not ASCII (line noise, wrong baud rate)
+    'oversize'     longer than the framer's max_line, dropped unparsed
+    'status'       firmware banner/status line (expected)
+
+    Rejections other than status lines are reported with a count and an
+    example, through a Reporter (report_interval None disables reports).
+    """
+
+    KINDS = ('field_count', 'bad_float', 'decode_error', 'oversize', 'status')
+    LABELS = {'field_count': 'wrong field count', 'bad_float': 'bad float',
+              'decode_error': 'decode error', 'oversize': 'oversize', 'status': 'status'}
+
+    def __init__(self, report_interval=5.0, stream=None, name=None):
+        self.reporter = Reporter(report_interval, stream, name)
+        self.samples = 0
+        self.counts = dict.fromkeys(self.KINDS, 0)
+        # Rejections since the last report, and an example line
+        self.unreported = dict.fromkeys(self.KINDS, 0)
+        self.example = None
+
+    def reject(self, kind, line=None, n=1):
+        self.counts[kind] += n
+        if kind == 'status' or not self.reporter.enabled:
+            return
+        self.unreported[kind] += n
+        if line is not None and self.example is None:
+            self.example = line
+        if self.reporter.due():
+            self.report()
+
+    def report(self):
+        """Print the rejections since the last report (if any)"""
+        counts = ', '.join(f"{n} {self.LABELS[kind]}"
+                           for kind, n in self.unreported.items() if n)
+        example = f", e.g. {self.example[:80]!r}" if self.example is not None else ""
+        self.reporter.report(f"Rejected lines: {counts}{example}" if counts else None)
+        self.unreported = dict.fromkeys(self.KINDS, 0)
+        self.example = None
+
+    @property
+    def rejected(self):
+        """Lines rejected for any reason except being a status line"""
+        return sum(self.counts.values()) - self.counts['status']
+
+    def as_dict(self):
+        return {'samples': self.samples, **self.counts}
+
+    def summary(self):
+        return ', '.join(f"{n} {self.LABELS[kind]}" for kind, n in self.counts.items())
+
+
+def parse_lines(lines, stats=None):
+    """Parse complete lines (bytes, no newline) into one SAMPLE_DTYPE array
+
+    Lines with the wrong field count or a non-numeric field (banner and
+    status lines included) are skipped; the rest of the batch is kept.
+    Forces-only lines are kept with NaN COPx and COPy.
+    If a ParseStats is given, parsed samples and skipped lines are counted
+    in it (the all-good batch costs one addition).
+    """
+    if not lines:
+        return empty_samples()
+    if len(lines) < SMALL_BATCH:
+        return _parse_small(lines, stats)
+    return _parse_bulk(lines, stats)
+
+
+def _parse_small(lines, stats=None):
+    """Small batches: float() per field into a flat array, NumPy only at the end"""
+    for line in lines:
+        if line.count(b',') != len(FIELDS) - 1:
+            return _parse_each(lines, stats)
+    try:
+        values = array('d', map(float, b','.join(lines).split(b',')))
+    except ValueError:
+        return _parse_each(lines, stats)
+    if stats is not None:
+        stats.samples += len(lines)
+    return np.frombuffer(values, SAMPLE_DTYPE)
+
+
+def _parse_bulk(lines, stats=None):
+    """Vectorised path: one join, one comma count and one float conversion per batch"""
+    # Commas per line, counted in a single pass over the joined batch
+    # (the trailing newline keeps every line start inside the buffer)
+    blob = b'\n'.join(lines) + b'\n'
+    raw = np.frombuffer(blob, np.uint8)
+    starts = np.flatnonzero(raw == _NEWLINE)
+    starts[1:] = starts[:-1] + 1
+    starts[0] = 0
+    per_line = np.add.reduceat(raw == _COMMA, starts, dtype=np.int32)
+    good = per_line == len(FIELDS) - 1
+    columns = len(FIELDS)
+
+    if good.all():
+        fields = blob[:-1].replace(b'\n', b',').split(b',')
+    else:
+        forces_only = per_line == len(FORCE_FIELDS) - 1
+        if forces_only.all():
+            columns = len(FORCE_FIELDS)
+            fields = blob[:-1].replace(b'\n', b',').split(b',')
+        else:
+            keep = good | forces_only
+            if stats is not None:
+                for i in np.flatnonzero(~keep):
+                    _reject(lines[i], 'field_count', stats)
+            lines = [lines[i] for i in np.flatnonzero(keep)]
+            if not lines:
+                return empty_samples()
+            if forces_only.any():
+                # Both line lengths in one batch: line by line
+                return _parse_each(lines, stats)
+            fields = b','.join(lines).split(b',')
+
+    try:
+        values = np.array(fields, np.float64)
+    except ValueError:
+        # Some field is not a number: fall back to per-line parsing for this batch
+        return _parse_each(lines, stats)
+
+    if stats is not None:
+        stats.samples += len(lines)
+    if columns < len(FIELDS):
+        values = np.column_stack((values.reshape(-1, columns),
+                                  np.full((len(lines), len(FIELDS) - columns), np.nan)))
+        return values.view(SAMPLE_DTYPE).reshape(-1)
+    return values.reshape(-1, len(FIELDS)).view(SAMPLE_DTYPE).reshape(-1)
+
+
+def _parse_each(lines, stats=None):
+    """Slow path for batches with rejected or forces-only lines - keeps every
+    line that parses"""
+    rows = []
+    for line in lines:
+        fields = line.split(b',')
+        if len(fields) != len(FIELDS) and len(fields) != len(FORCE_FIELDS):
+            if stats is not None:
+                _reject(line, 'field_count', stats)
+            continue
+        try:
+            row = [float(x) for x in fields]
+        except ValueError:
+            if stats is not None:
+                _reject(line, 'bad_float', stats)
+            continue
+        if len(row) == len(FORCE_FIELDS):
+            row += [np.nan, np.nan]
+        rows.append(row)
+    if stats is not None:
+        stats.samples += len(rows)
+    if not rows:
+        return empty_samples()
+    return np.array(rows, np.float64).view(SAMPLE_DTYPE).reshape(-1)
+
+
+def _reject(line, kind, stats):
+    """Count a skipped line as kind, unless it is blank, not ASCII or a status line"""
+    if not line.strip():
+        return
+    if not line.isascii():
+        kind = 'decode_error'
+    elif line.lstrip().startswith(STATUS_PREFIXES):
+        kind = 'status'
+    stats.reject(kind, line)
+
+
+def format_samples(samples, forces_only=False):
+    """CSV lines (bytes, no newline) for samples, e.g. ones decoded from binary frames"""
+    if forces_only:
+        return [b'%.15g,%.6g,%.6g,%.6g,%.6g' % tuple(row)
+                for row in as_matrix(samples)[:, :len(FORCE_FIELDS)].tolist()]
+    return [b'%.15g,%.6g,%.6g,%.6g,%.6g,%.6g,%.6g' % tuple(row)
+            for row in as_matrix(samples).tolist()]
@@ -3,47 +3,304 @@ Balance Board Data Receiver - Simple Console Output
 Data format: TIME,F1,F2,F3,F4,COPx,COPy
 """
 
+import argparse
+import asyncio
+import sys
+
 import serial
 import time
 
+from balanceboardcop import CopCheck, add_geometry_args, geometry_from_args
+from balanceboardfilter import TARGETS, LowPassFilter
+from balanceboardframing import StreamDecoder
+from balanceboardmetrics import SwayMetrics
+from balanceboardparser import format_samples
+from balanceboardrecorder import SessionRecorder
+from balanceboardsources import open_source
+from balanceboardtiming import ClockSync, TimeTracker
+
+OUTPUT_MODES = ('line', 'buffered', 'raw', 'none')
+
+
+class ConsoleOutput:
+    """Write received lines to the console
+
+    'line'     decode, strip and print each line with a flush (the original behaviour)
+    'buffered' same text, flushed when flush_bytes pile up or flush_interval passes
+    'raw'      complete lines as received, straight to the binary stream, same flushing
+    'none'     discard (e.g. when only recording)
+    """
+
+    def __init__(self, mode='line', stream=None, flush_bytes=64 * 1024, flush_interval=0.1):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {mode}")
+        self.mode = mode
+        # None: whatever sys.stdout is at the time of writing (it may be redirected)
+        self.stream = stream
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.pending = bytearray()
+        self.last_flush = time.monotonic()
+
+    @property
+    def out(self):
+        return self.stream if self.stream is not None else sys.stdout
+
+    def write(self, lines):
+        """Output a batch of lines (bytes, no newline)"""
+        if self.mode == 'line':
+            for line in lines:
+                line = line.decode('utf-8', errors='ignore').strip()
+                if line:
+                    print(line, file=self.out, flush=True)
+            return
+        if self.mode == 'none' or not lines:
+            return
+
+        if self.mode == 'raw':
+            self.pending += b'\n'.join(lines)
+            self.pending += b'\n'
+        else:
+            text = [line.decode('utf-8', errors='ignore').strip() for line in lines]
+            text = '\n'.join(line for line in text if line)
+            if text:
+                self.pending += text.encode('utf-8')
+                self.pending += b'\n'
+        if len(self.pending) >= self.flush_bytes:
+            self.flush()
+
+    def poll(self):
+        """Flush if flush_interval has passed - call even when no data arrives"""
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            # The text layer may hold earlier print() output; keep the order
+            out = self.out
+            out.flush()
+            out.buffer.write(self.pending)
+            out.buffer.flush()
+            self.pending.clear()
+        self.last_flush = time.monotonic()
+
+
 class BalanceBoardReceiver:
-    def __init__(self, port, baudrate=115200):
-        self.ser = serial.Serial(port, baudrate, timeout=0)
-        self.ser.reset_input_buffer()
-        print(f"Connected to {port} at {baudrate} baud\n")
+    def __init__(self, port, baudrate=115200, read_mode='blocking', max_latency=0.05,
+                 on_samples=None, protocol='auto', record=None, output='line', metrics=None,
+                 lowpass=None, lowpass_target='both', cop='device', board=None):
+        # port: a serial port name, a source spec (tcp://, udp://, pty:, file:) or a Source
+        # 'blocking' sleeps in the OS until data arrives (or max_latency seconds pass),
+        # 'poll' is the old timeout=0 busy loop, kept for comparison
+        if read_mode not in ('blocking', 'poll'):
+            raise ValueError(f"Unknown read_mode: {read_mode}")
+        self.read_mode = read_mode
+        self.max_latency = max_latency
+        self.running = False
+        # CSV lines, binary frames, or whichever the stream turns out to carry
+        self.decoder = StreamDecoder(protocol)
+        # Sample rate and losses, from the device TIME of every parsed sample
+        self.timing = TimeTracker()
+        # Device TIME -> host time.monotonic_ns(), fitted from the arrival time of each chunk
+        self.clock = ClockSync()
+        # Sway metrics, headless: metrics is a tuple of sliding-window lengths in seconds
+        self.metrics = SwayMetrics(metrics) if metrics is not None else None
+        # Low-pass cutoff in Hz (None: off) for what is shown ('display': console, on_samples,
+        # stream()), what is recorded ('record', metrics too) or 'both'
+        if lowpass_target not in TARGETS:
+            raise ValueError(f"Unknown lowpass_target: {lowpass_target}")
+        self.lowpass = LowPassFilter(lowpass) if lowpass is not None else None
+        self.filter_display = self.lowpass is not None and lowpass_target != 'record'
+        self.filter_record = self.lowpass is not None and lowpass_target != 'display'
+        # COP from F1-F4 and the board geometry: checks the device's ('device') or
+        # replaces it ('host'); forces-only lines get it either way
+        self.cop = CopCheck(board, cop)
+        # Console shows parsed samples rather than the lines as received
+        self.rewrite = self.filter_display or cop == 'host'
+        # Called with each parsed SAMPLE_DTYPE batch
+        self.on_samples = on_samples
+        self.console = ConsoleOutput(output)
+
+        self.source = open_source(port, baudrate, max_latency)
+        print(f"Connected to {self.source}\n")
+
+        # Optional session file, written on a background thread
+        self.recorder = None
+        if record is not None:
+            metadata = {'port': str(port), 'baudrate': baudrate}
+            if self.filter_record:
+                metadata['filter'] = str(self.lowpass)
+            if cop == 'host':
+                metadata['cop'] = f"host, {self.cop.geometry}"
+            self.recorder = SessionRecorder(record, metadata)
+            print(f"Recording to {record}\n")
+
+    def read_chunk(self):
+        """Return the bytes currently available (b'' if none)"""
+        if self.read_mode == 'poll':
+            return self.source.read_nowait()
+        return self.source.read()
 
     def start(self):
         """Read and print data continuously"""
-        buffer = ""
+        self.running = True
 
-        while True:
+        while self.running:
             try:
-                if self.ser.in_waiting > 0:
-                    chunk = self.ser.read(self.ser.in_waiting).decode('utf-8', errors='ignore')
-                    buffer += chunk
+                chunk = self.read_chunk()
+                if chunk:
+                    stamp = time.monotonic_ns()
+                    lines, frames = self.decoder.feed(chunk)
+                    # Parsed even when only printed: losses, rejected lines and COP
+                    # divergence are reported whatever the output
+                    samples = self.deliver(lines, frames, stamp)
+                    if len(samples) and self.on_samples is not None:
+                        self.on_samples(samples)
 
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        line = line.strip()
-                        if line:
-                            print(line, flush=True)
+                    if self.rewrite:
+                        # Filtered values or host COP replace the lines as received
+                        # (status lines too)
+                        lines = format_samples(samples) if self.console.mode != 'none' else []
+                    elif len(frames) and self.console.mode != 'none':
+                        # Binary samples are printed in the CSV format
+                        lines += format_samples(frames)
 
-            except KeyboardInterrupt:
+                    self.console.write(lines)
+                self.console.poll()
+
+            except (KeyboardInterrupt, EOFError):
+                break
+            except OSError as e:
+                # Port unplugged or connection dropped; anything else is a bug and propagates
+                print(f"Connection lost: {e}", file=sys.stderr)
+                break
+
+    def deliver(self, lines, frames, stamp=None):
+        """Parse lines, merge with decoded frames and record the batch
+
+        stamp is the time.monotonic_ns() at which the chunk was read. Returns
+        the samples for display (low-pass filtered if that was asked for).
+        """
+        samples = self.cop.apply(self.decoder.merge(lines, frames))
+        self.timing.update(samples)
+        if len(samples) and stamp is not None:
+            self.clock.observe(stamp, samples['time'][-1])
+        filtered = self.lowpass.filter(samples) if self.lowpass is not None else samples
+        recorded = filtered if self.filter_record else samples
+        if len(samples) and self.recorder is not None:
+            self.recorder.write(recorded, self.host_times(samples))
+        if self.metrics is not None:
+            self.metrics.update(recorded)
+        return filtered if self.filter_display else samples
+
+    def host_times(self, samples):
+        """Host-aligned time.monotonic_ns() of each sample (int64), from the current fit"""
+        return self.clock.to_host(samples['time'])
+
+    async def stream(self):
+        """Async iterator of SAMPLE_DTYPE batches: async for batch in receiver.stream()
+
+        Woken by the event loop when the source's fd becomes readable, so one loop can
+        serve many boards next to network I/O. Nothing is printed; recording still
+        applies. Sources without a fileno() (Windows serial, file replay), and loops
+        without add_reader() (Windows' default ProactorEventLoop), are read on a
+        worker thread instead. Ends when the source does.
+        """
+        loop = asyncio.get_running_loop()
+        fd = self.source.fileno()
+        self.running = True
+
+        while self.running:
+            try:
+                if fd is not None:
+                    await self._readable(loop, fd)
+                    chunk = self.source.read_nowait()
+                else:
+                    chunk = await loop.run_in_executor(None, self.read_chunk)
+            except NotImplementedError:
+                # No add_reader() on this loop: worker thread from now on
+                fd = None
+                continue
+            except EOFError:
                 break
-            except:
-                pass
+
+            if chunk:
+                stamp = time.monotonic_ns()
+                samples = self.deliver(*self.decoder.feed(chunk), stamp)
+                if len(samples):
+                    yield samples
+
+    @staticmethod
+    async def _readable(loop, fd):
+        # One-shot reader: re-armed per wait so an idle consumer never spins the loop
+        ready = loop.create_future()
+        loop.add_reader(fd, ready.set_result, None)
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+
+    def stats(self):
+        """Parse, frame, timing and COP counters (printed lines are still passed
+        through as received unless filtered or given host COP)"""
+        return {**self.decoder.counters(), **self.timing.as_dict(), **self.cop.as_dict()}
+
+    def stop(self):
+        """Make start() or stream() return after the current read"""
+        self.running = False
 
     def close(self):
-        self.ser.close()
+        self.console.flush()
+        self.source.close()
         print("\nSerial connection closed")
+        stats = self.decoder.stats
+        if stats.samples or stats.rejected:
+            print(f"Parsed {stats.samples} samples; rejected lines: {stats.summary()}")
+            print(f"Device TIME: {self.timing.summary()}")
+            if self.clock.windows:
+                print(f"Device clock: {self.clock.drift_ppm:+.1f} ppm against the host")
+            print(f"COP: {self.cop.summary()}")
+        if self.lowpass is not None:
+            targets = [name for name, on in (('display', self.filter_display),
+                                             ('recording', self.filter_record)) if on]
+            print(f"Filter: {self.lowpass} on {' and '.join(targets)}")
+        if self.metrics is not None:
+            print(self.metrics.text())
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.samples_written} samples to {self.recorder.path}")
+            if self.recorder.error is not None:
+                print(f"Recording error: {self.recorder.error}")
 
 
 def main():
-    PORT = 'COM7'
+    parser = argparse.ArgumentParser(description="Balance board console receiver")
+    parser.add_argument('port', nargs='?', default='COM7',
+                        help="serial port, tcp://host:port, udp://:port, pty:PATH or file:PATH")
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--record', metavar='PATH', help="also save samples to a session file")
+    parser.add_argument('--output', choices=OUTPUT_MODES, default='line',
+                        help="console output mode (default: line)")
+    parser.add_argument('--metrics', type=float, nargs='*', metavar='SECONDS',
+                        help="sway metrics over the session and these sliding windows "
+                             "(default 10 s), printed on exit")
+    parser.add_argument('--lowpass', type=float, metavar='HZ',
+                        help="low-pass filter forces and COP at this cutoff")
+    parser.add_argument('--lowpass-target', choices=TARGETS, default='both',
+                        help="filter what is shown, what is recorded, or both (default)")
+    add_geometry_args(parser)
+    args = parser.parse_args()
+
+    PORT = args.port
     try:
-        receiver = BalanceBoardReceiver(PORT)
+        metrics = None if args.metrics is None else tuple(args.metrics or (10.0,))
+        board = geometry_from_args(args)
+        receiver = BalanceBoardReceiver(PORT, args.baudrate, record=args.record,
+                                        output=args.output, metrics=metrics,
+                                        lowpass=args.lowpass, lowpass_target=args.lowpass_target,
+                                        cop=args.cop, board=board)
         receiver.start()
-    except serial.SerialException as e:
+    except (serial.SerialException, OSError) as e:
         print(f"Error: Could not open serial port {PORT}")
         print(f"Details: {e}")
     except Exception as e:
@@ -0,0 +1,134 @@
+"""
+Balance Board Session Recorder - parsed samples to a compact binary file
+File layout: MAGIC, u32 header length, JSON header, then packed SESSION_DTYPE records
+"""
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from balanceboardparser import FIELDS, empty_samples
+
+MAGIC = b'BBSESSION\x00'
+VERSION = 2
+# 40 bytes per sample: TIME keeps full precision, forces/COP fit float32, and
+# host_ns is the host-aligned time.monotonic_ns() (-1 if unknown; not in version 1)
+SESSION_DTYPE = np.dtype([('time', '<f8')] + [(name, '<f4') for name in FIELDS[1:]]
+                         + [('host_ns', '<i8')])
+
+
+class SessionRecorder:
+    """Append sample batches to a session file from a background writer thread
+
+    write() only queues the batch, so a slow disk never blocks the caller.
+    Data is flushed when flush_bytes have accumulated or flush_interval
+    seconds have passed, whichever comes first.
+    """
+
+    def __init__(self, path, metadata=None, flush_bytes=256 * 1024, flush_interval=1.0,
+                 fsync=True):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.samples_written = 0
+        self.flushes = 0
+        self.error = None
+
+        header = {'version': VERSION, 'dtype': SESSION_DTYPE.descr,
+                  'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'), **(metadata or {})}
+        header = json.dumps(header).encode()
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+
+        self.queue = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._run, daemon=True)
+        self.writer.start()
+
+    def write(self, samples, host_ns=None):
+        """Queue a SAMPLE_DTYPE batch, and optionally its host times, for writing (never blocks)"""
+        if len(samples):
+            self.queue.put((samples, host_ns))
+
+    def close(self):
+        """Flush everything queued and close the file"""
+        self.queue.put(None)
+        self.writer.join()
+        self.file.close()
+
+    def _run(self):
+        pending = []
+        pending_bytes = 0
+        deadline = time.monotonic() + self.flush_interval
+        done = False
+
+        while not done:
+            try:
+                batch = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if batch is None:
+                    done = True
+                else:
+                    pending.append(batch)
+                    pending_bytes += len(batch[0]) * SESSION_DTYPE.itemsize
+            except queue.Empty:
+                pass
+
+            if done or pending_bytes >= self.flush_bytes or time.monotonic() >= deadline:
+                if pending:
+                    self._flush(pending)
+                    pending = []
+                    pending_bytes = 0
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batches):
+        records = np.empty(sum(len(samples) for samples, _ in batches), SESSION_DTYPE)
+        start = 0
+        for samples, host_ns in batches:
+            block = records[start:start + len(samples)]
+            for name in FIELDS:
+                block[name] = samples[name]
+            block['host_ns'] = -1 if host_ns is None else host_ns
+            start += len(samples)
+        try:
+            self.file.write(records.tobytes())
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+        except OSError as e:
+            # Keep draining the queue so the reader side never backs up
+            self.error = e
+            return
+        self.samples_written += len(records)
+        self.flushes += 1
+
+
+def read_session(path, host_times=False):
+    """Return (header, samples) of a recorded session as a SAMPLE_DTYPE array
+
+    With host_times=True, return (header, samples, host_ns) where host_ns is
+    the int64 host-aligned time of each sample (-1 where unknown), or None for
+    files recorded without it.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a balance board session file")
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+        dtype = np.dtype([tuple(field) for field in header['dtype']])
+        data = f.read()
+
+    # A crash can leave a partial record at the end
+    records = np.frombuffer(data, dtype, len(data) // dtype.itemsize)
+
+    samples = empty_samples(len(records))
+    for name in FIELDS:
+        samples[name] = records[name]
+    if not host_times:
+        return header, samples
+    host_ns = records['host_ns'].astype(np.int64) if 'host_ns' in dtype.names else None
+    return header, samples, host_ns
@@ -0,0 +1,180 @@
+"""
+Balance Board Session Replay - recorded sessions back through the live pipeline
+Paced by the recorded TIME column (ms) at 1x, Nx or maximum speed; batches are cut
+on fixed windows of recorded time, so every replay of a session is identical
+Output format: TIME,F1,F2,F3,F4,COPx,COPy
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from balanceboardframing import StreamDecoder, encode_frames
+from balanceboardparser import format_samples
+from balanceboardrecorder import read_session
+from balanceboardsources import Source
+from balanceboardtiming import TimeTracker
+
+
+class SessionReplay:
+    """Iterate over a recorded session in batch_ms windows of its TIME column
+
+    speed=1 replays in real time, speed=N N times faster, None as fast as the
+    consumer takes it. Batch contents never depend on speed or host timing.
+    """
+
+    def __init__(self, path, speed=1.0, batch_ms=10.0):
+        if speed is not None and speed <= 0:
+            raise ValueError(f"speed must be positive (or None for maximum): {speed}")
+        self.path = path
+        self.speed = speed
+        self.header, self.samples = read_session(path)
+
+        t = self.samples['time']
+        if len(t):
+            # A batch ends wherever the recorded clock crosses into a new window
+            window = np.floor((t - t[0]) / batch_ms)
+            self.ends = np.append(np.flatnonzero(np.diff(window)) + 1, len(t))
+            # Seconds after the start at which each batch is complete; a clock that
+            # steps back (device reset) just releases the next batches immediately
+            self.due = np.maximum.accumulate(t[self.ends - 1] - t[0]) / 1000.0
+        else:
+            self.ends = np.zeros(0, np.intp)
+            self.due = np.zeros(0)
+
+        self.pos = 0
+        self.batch = 0
+        self.started = None
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __iter__(self):
+        while True:
+            samples = self.next_due(block=True)
+            if samples is None:
+                return
+            if len(samples):
+                yield samples
+
+    def next_due(self, block=False, timeout=None, max_samples=4096):
+        """Samples now due (an empty array if none yet, None once the session is done)
+
+        At maximum speed up to max_samples whole batches are released per call.
+        block waits for the next batch, for at most timeout seconds if given.
+        """
+        if self.batch >= len(self.ends):
+            return None
+        if self.started is None:
+            self.started = time.monotonic()
+
+        if self.speed is None:
+            limit = np.searchsorted(self.ends, self.pos + max_samples, 'right')
+            count = max(1, limit - self.batch)
+        else:
+            elapsed = (time.monotonic() - self.started) * self.speed
+            count = np.searchsorted(self.due, elapsed, 'right') - self.batch
+            if count <= 0 and block:
+                delay = (self.due[self.batch] - elapsed) / self.speed
+                time.sleep(delay if timeout is None else min(delay, timeout))
+                elapsed = (time.monotonic() - self.started) * self.speed
+                count = np.searchsorted(self.due, elapsed, 'right') - self.batch
+            if count <= 0:
+                return self.samples[:0]
+
+        self.batch += count
+        start, self.pos = self.pos, int(self.ends[self.batch - 1])
+        return self.samples[start:self.pos]
+
+
+class SessionSource(Source):
+    """A recorded session as a byte stream (CSV text or binary frames)
+
+    Lets the receiver, visualiser and multi-board receiver run on recordings
+    through the same framing and parsing as a live board.
+    """
+
+    def __init__(self, path, speed=1.0, protocol='text', timeout=0.05):
+        if protocol not in ('text', 'binary'):
+            raise ValueError(f"Unknown replay protocol: {protocol}")
+        self.replay = SessionReplay(path, speed)
+        self.protocol = protocol
+        self.timeout = timeout
+
+    def read(self):
+        return self._encode(self.replay.next_due(block=True, timeout=self.timeout))
+
+    def read_nowait(self):
+        return self._encode(self.replay.next_due())
+
+    def _encode(self, samples):
+        if samples is None:
+            raise EOFError(self.replay.path)
+        if not len(samples):
+            return b''
+        if self.protocol == 'binary':
+            return encode_frames(samples, self.replay.pos - len(samples))
+        return b'\n'.join(format_samples(samples)) + b'\n'
+
+    def __str__(self):
+        speed = 'maximum speed' if self.replay.speed is None else f"{self.replay.speed:g}x"
+        return f"session {self.replay.path} at {speed}"
+
+
+def replay_csv(path, out, speed=None, protocol='text', timing=None):
+    """Replay a session through StreamDecoder, writing CSV to out
+
+    Returns the number of samples written. Two builds can be compared by
+    diffing their output for the same session. A TimeTracker, if given,
+    sees every replayed sample.
+    """
+    source = SessionSource(path, speed, protocol)
+    decoder = StreamDecoder(protocol)
+    count = 0
+    while True:
+        try:
+            chunk = source.read()
+        except EOFError:
+            break
+        samples = decoder.decode(chunk)
+        if len(samples):
+            if timing is not None:
+                timing.update(samples)
+            out.write(b'\n'.join(format_samples(samples)) + b'\n')
+            count += len(samples)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded balance board session")
+    parser.add_argument('session')
+    parser.add_argument('--speed', default='max',
+                        help="1 = real time, N = N times faster, max = as fast as possible")
+    parser.add_argument('--protocol', choices=('text', 'binary'), default='text',
+                        help="wire format to replay through (default: text)")
+    parser.add_argument('-o', '--output', metavar='PATH', help="write CSV here instead of stdout")
+    args = parser.parse_args()
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    # Losses in the recording itself; reported at the end only
+    timing = TimeTracker(report_interval=None)
+    t0 = time.perf_counter()
+    try:
+        count = replay_csv(args.session, out, speed, args.protocol, timing)
+    except KeyboardInterrupt:
+        count = None
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    if count is not None:
+        print(f"Replayed {count} samples in {time.perf_counter() - t0:.2f} s", file=sys.stderr)
+        print(f"Device TIME: {timing.summary()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Balance Board Reports - rate-limited warnings on stderr
+Shared by the parse, TIME and COP checks, so a stream of bad data costs one
+line every few seconds rather than one per batch
+"""
+
+import sys
+import time
+
+
+class Reporter:
+    """Print at most one report per interval seconds
+
+    interval None disables reports. stream None means sys.stderr at the time
+    of printing. name prefixes every report (e.g. the board).
+    """
+
+    def __init__(self, interval=5.0, stream=None, name=None):
+        self.interval = interval
+        self.stream = stream
+        self.name = name
+        self.last = None
+
+    @property
+    def enabled(self):
+        return self.interval is not None
+
+    def due(self):
+        """True if reports are on and the last one was at least interval seconds ago"""
+        if self.interval is None:
+            return False
+        return self.last is None or time.monotonic() - self.last >= self.interval
+
+    def report(self, message):
+        """Print message (unless empty) and start a new interval"""
+        if message:
+            prefix = f"{self.name}: " if self.name is not None else ""
+            print(prefix + message, file=self.stream if self.stream is not None else sys.stderr)
+        self.last = time.monotonic()
@@ -0,0 +1,229 @@
+"""
+Balance Board Simulator - a fake board on a pseudo-terminal (Linux/macOS)
+Prints the firmware banner, then TIME,F1,F2,F3,F4,COPx,COPy samples with realistic sway
+(TIME,F1,F2,F3,F4 with --forces-only, as firmware that leaves COP to the host)
+Point the receiver or visualizer at the printed /dev/pts/N path
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from balanceboardcop import BoardGeometry
+from balanceboardframing import encode_frames
+from balanceboardparser import empty_samples, format_samples
+
+BANNER = [
+    b"Setup: initialising load cells",
+    b"Taring... keep the board empty",
+    b"Calculating offsets",
+    b"Force sensors ready",
+    b"Format: TIME,F1,F2,F3,F4,COPx,COPy",
+]
+
+
+class SwayModel:
+    """Quiet-standing COP: mean-reverting random walk plus slow breathing sway"""
+
+    def __init__(self, rate, mass=70.0, amplitude=1.5, seed=None, geometry=None):
+        self.rate = rate
+        self.mass = mass
+        self.amplitude = amplitude
+        # Where the forces land: the 60 x 45 cm board with sensors at its corners by default
+        self.geometry = geometry if geometry is not None else BoardGeometry()
+        self.rng = np.random.default_rng(seed)
+        self.index = 0
+        self.pos = np.zeros(2)
+
+    def next(self, n):
+        """SAMPLE_DTYPE batch of the next n samples"""
+        dt = 1.0 / self.rate
+        t = (self.index + np.arange(n)) * dt
+        self.index += n
+
+        # Ornstein-Uhlenbeck walk (time constant ~1 s): x[k] = decay * x[k-1] + kick[k],
+        # solved in closed form over blocks short enough for decay**k not to underflow
+        decay = np.exp(-dt)
+        kicks = self.rng.normal(0.0, self.amplitude * np.sqrt(1 - decay ** 2), (n, 2))
+        walk = np.empty((n, 2))
+        for i in range(0, n, 256):
+            block = kicks[i:i + 256]
+            powers = decay ** np.arange(1, len(block) + 1)[:, None]
+            walk[i:i + 256] = powers * (self.pos + np.cumsum(block / powers, axis=0))
+            self.pos = walk[i + len(block) - 1]
+
+        copx = walk[:, 0] + 0.3 * np.sin(2 * np.pi * 0.25 * t)
+        copy = walk[:, 1] + 0.5 * np.sin(2 * np.pi * 0.2 * t + 1.0)
+
+        samples = empty_samples(n)
+        samples['time'] = np.round(t * 1000, 3)
+        samples['copx'] = copx
+        samples['copy'] = copy
+        samples['f1'], samples['f2'], samples['f3'], samples['f4'] = self.geometry.split(
+            self.mass, copx, copy)
+        return samples
+
+
+class BoardSimulator:
+    """Stream a simulated board to a pty at a given sample rate and baud rate
+
+    baudrate=0 disables pacing, so the readers can be pushed as hard as they go.
+    Faults: noise (Kg std on each force), drop_bytes and corrupt_lines
+    (probabilities), and bursts (hold output for burst_hold s every burst_every s).
+    forces_only sends text lines without COPx and COPy.
+    """
+
+    def __init__(self, rate=100.0, baudrate=115200, protocol='text', noise=0.0,
+                 drop_bytes=0.0, corrupt_lines=0.0, burst_every=0.0, burst_hold=0.0,
+                 seed=None, tick=0.01, forces_only=False):
+        self.rate = rate
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self.noise = noise
+        self.drop_bytes = drop_bytes
+        self.corrupt_lines = corrupt_lines
+        self.burst_every = burst_every
+        self.burst_hold = burst_hold
+        self.tick = tick
+        self.forces_only = forces_only
+        self.model = SwayModel(rate, seed=seed)
+        self.rng = np.random.default_rng(None if seed is None else seed + 1)
+
+        self.master, self.slave = os.openpty()
+        self.path = os.ttyname(self.slave)
+        self.samples_sent = 0
+        self.bytes_sent = 0
+        # Wire bytes per sample, refined from what was actually sent
+        self.sample_bytes = 38 if protocol == 'binary' else 50
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Run in a background thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self, duration=None):
+        """Send the banner, then samples until stop() (or duration seconds)"""
+        self.running = True
+        banner = BANNER[:-1] + [b"Format: TIME,F1,F2,F3,F4"] if self.forces_only else BANNER
+        self._write(b"\n".join(banner) + b"\n")
+
+        start = time.perf_counter()
+        next_t = start
+        held = []
+
+        while self.running:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+
+            # Samples due since the start, as the firmware's own clock would produce them
+            due = int((now - start) * self.rate) - self.model.index
+            if due > 0:
+                samples = self.model.next(due)
+                if self.baudrate:
+                    # A saturated link stalls the firmware loop, so it samples less
+                    # often and TIME shows the gaps (10 bits per byte on the wire)
+                    fits = max(1, int(self.baudrate / 10 * self.tick / self.sample_bytes))
+                    if due > fits:
+                        samples = samples[::int(np.ceil(due / fits))]
+                data = self._encode(samples)
+                self.sample_bytes = len(data) / len(samples)
+
+                if self._holding(now - start):
+                    held.append(data)
+                else:
+                    if held:
+                        data = b"".join(held) + data
+                        held = []
+                    self._write(data)
+
+            next_t += self.tick
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.running = False
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _holding(self, elapsed):
+        if not self.burst_every:
+            return False
+        return elapsed % self.burst_every >= self.burst_every - self.burst_hold
+
+    def _encode(self, samples):
+        if self.noise:
+            for name in ('f1', 'f2', 'f3', 'f4'):
+                samples[name] += self.rng.normal(0.0, self.noise, len(samples))
+        self.samples_sent += len(samples)
+
+        if self.protocol == 'binary':
+            data = encode_frames(samples, self.samples_sent - len(samples))
+        else:
+            lines = format_samples(samples, self.forces_only)
+            if self.corrupt_lines:
+                for i in np.flatnonzero(self.rng.random(len(lines)) < self.corrupt_lines):
+                    line = bytearray(lines[i])
+                    line[self.rng.integers(len(line))] = self.rng.choice(list(b"x,.-"))
+                    lines[i] = bytes(line)
+            data = b"\n".join(lines) + b"\n"
+
+        if self.drop_bytes:
+            keep = self.rng.random(len(data)) >= self.drop_bytes
+            data = np.frombuffer(data, np.uint8)[keep].tobytes()
+        return data
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.master, view)
+            view = view[written:]
+        self.bytes_sent += len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated balance board on a pty")
+    parser.add_argument('--rate', type=float, default=100.0, help="samples/s (default 100)")
+    parser.add_argument('--baudrate', type=int, default=115200, help="0 = unlimited")
+    parser.add_argument('--protocol', choices=('text', 'binary'), default='text')
+    parser.add_argument('--noise', type=float, default=0.0, help="force noise std, Kg")
+    parser.add_argument('--drop-bytes', type=float, default=0.0, help="probability per byte")
+    parser.add_argument('--corrupt-lines', type=float, default=0.0, help="probability per line")
+    parser.add_argument('--burst-every', type=float, default=0.0, help="seconds between bursts")
+    parser.add_argument('--burst-hold', type=float, default=0.0, help="seconds held per burst")
+    parser.add_argument('--duration', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--forces-only', action='store_true',
+                        help="send TIME,F1,F2,F3,F4 (text only), leaving COP to the host")
+    args = parser.parse_args()
+
+    simulator = BoardSimulator(args.rate, args.baudrate, args.protocol, args.noise,
+                               args.drop_bytes, args.corrupt_lines, args.burst_every,
+                               args.burst_hold, args.seed, forces_only=args.forces_only)
+    print(f"Simulated board on {simulator.path} ({args.rate:g} samples/s, "
+          f"{args.baudrate or 'unlimited'} baud, {args.protocol})")
+    print("Press Ctrl+C to stop\n")
+    try:
+        simulator.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+        print(f"\nSent {simulator.samples_sent} samples, {simulator.bytes_sent} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Balance Board Data Sources - where the byte stream comes from
+Every source feeds the same StreamDecoder, so framing and parsing don't care
+
+    COM7, /dev/ttyUSB0     serial port
+    pty:/dev/pts/3         pseudo-terminal (e.g. balanceboardsimulator.py)
+    tcp://host:port        TCP client (serial-to-network relay)
+    udp://[host]:port      UDP listener, one or more samples per datagram
+    file:capture.txt       replay of a raw capture; ?bps=11520 paces it, ?loop=1 repeats
+    session:run.bbs        replay of a recorded session; ?speed=10 (default 1, or max)
+                           and ?protocol=binary (default text)
+"""
+
+import os
+import select
+import socket
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import serial
+
+
+class Source:
+    """A byte stream the readers consume
+
+    read() waits up to timeout seconds for data and returns everything
+    available (b'' on timeout). read_nowait() never waits. Both raise
+    EOFError once the stream has ended. fileno() is an fd that selectors and
+    asyncio can wait on, or None if the source can't offer one.
+    """
+
+    timeout = 0.05
+
+    def read(self):
+        raise NotImplementedError
+
+    def read_nowait(self):
+        raise NotImplementedError
+
+    def fileno(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class SerialSource(Source):
+    def __init__(self, port, baudrate=115200, timeout=0.05):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.ser = serial.Serial(port, baudrate, timeout=timeout)
+        self.ser.reset_input_buffer()
+
+    def read(self):
+        # Wait for at least one byte, then take everything queued behind it, so a
+        # packet isn't split into its first byte and the rest
+        data = self.ser.read(1)
+        if data:
+            waiting = self.ser.in_waiting
+            if waiting:
+                data += self.ser.read(waiting)
+        return data
+
+    def read_nowait(self):
+        waiting = self.ser.in_waiting
+        return self.ser.read(waiting) if waiting > 0 else b''
+
+    def fileno(self):
+        # pyserial has no fileno() on Windows
+        fileno = getattr(self.ser, 'fileno', None)
+        return fileno() if fileno is not None else None
+
+    def close(self):
+        self.ser.close()
+
+    def __str__(self):
+        return f"{self.port} at {self.baudrate} baud"
+
+
+class _FdSource(Source):
+    """Shared read path for sources backed by a non-blocking fd"""
+
+    def read(self):
+        ready, _, _ = select.select([self.fileno()], [], [], self.timeout)
+        return self.read_nowait() if ready else b''
+
+
+class PtySource(_FdSource):
+    """A pseudo-terminal opened directly, without pyserial"""
+
+    def __init__(self, path, timeout=0.05):
+        import tty
+        self.path = path
+        self.timeout = timeout
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        # No echo or newline translation
+        tty.setraw(self.fd)
+
+    def read_nowait(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return b''
+        except OSError:
+            # EIO: the other end of the pty has gone
+            raise EOFError(self.path)
+        if not data:
+            raise EOFError(self.path)
+        return data
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def __str__(self):
+        return f"pty {self.path}"
+
+
+class TcpSource(_FdSource):
+    """TCP client, e.g. to a serial-to-network relay"""
+
+    def __init__(self, host, port, timeout=0.05, connect_timeout=5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.sock = socket.create_connection(self.address, connect_timeout)
+        self.sock.setblocking(False)
+
+    def read_nowait(self):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return b''
+        if not data:
+            raise EOFError(f"{self.address[0]}:{self.address[1]} closed the connection")
+        return data
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def __str__(self):
+        return f"tcp://{self.address[0]}:{self.address[1]}"
+
+
+class UdpSource(_FdSource):
+    """UDP listener; the payloads of all queued datagrams are returned together"""
+
+    def __init__(self, host, port, timeout=0.05):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(self.address)
+        self.sock.setblocking(False)
+
+    def read_nowait(self):
+        datagrams = []
+        while True:
+            try:
+                datagrams.append(self.sock.recv(65536))
+            except BlockingIOError:
+                return b''.join(datagrams)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def __str__(self):
+        return f"udp://{self.address[0]}:{self.address[1]}"
+
+
+class FileSource(Source):
+    """Replay a raw capture (CSV text or binary frames) in chunk_size reads
+
+    bps paces the replay in bytes per second (115200 baud is ~11520);
+    None replays as fast as the reader consumes it.
+    """
+
+    def __init__(self, path, bps=None, chunk_size=4096, loop=False, timeout=0.05):
+        self.path = path
+        self.bps = bps
+        self.chunk_size = chunk_size
+        self.loop = loop
+        self.timeout = timeout
+        self.file = open(path, 'rb')
+        self.started = None
+        self.sent = 0
+
+    def read(self):
+        if self.bps is not None and self._due() <= 0:
+            # Nothing due yet: wait for the next byte, at most timeout
+            elapsed = time.monotonic() - self.started
+            time.sleep(min(self.timeout, max(0.0, (self.sent + 1) / self.bps - elapsed)))
+        return self.read_nowait()
+
+    def read_nowait(self):
+        if self.bps is None:
+            return self._take(self.chunk_size)
+        # Only what the link would have delivered by now
+        due = self._due()
+        return self._take(min(due, self.chunk_size)) if due > 0 else b''
+
+    def _due(self):
+        if self.started is None:
+            self.started = time.monotonic()
+        return int((time.monotonic() - self.started) * self.bps) - self.sent
+
+    def _take(self, size):
+        data = self.file.read(size)
+        if not data:
+            if not self.loop:
+                raise EOFError(self.path)
+            self.file.seek(0)
+            data = self.file.read(size)
+        self.sent += len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+    def __str__(self):
+        return f"file {self.path}"
+
+
+def open_source(spec, baudrate=115200, timeout=0.05):
+    """Open a Source from a spec string (see module docstring); Sources pass through"""
+    if isinstance(spec, Source):
+        return spec
+
+    if spec.startswith('pty:'):
+        return PtySource(spec[4:], timeout)
+    if spec.startswith('file:'):
+        url = urlsplit(spec)
+        query = parse_qs(url.query)
+        bps = float(query['bps'][0]) if 'bps' in query else None
+        loop = query.get('loop', ['0'])[0] not in ('0', 'false', '')
+        return FileSource(url.netloc + url.path, bps, loop=loop, timeout=timeout)
+    if spec.startswith('session:'):
+        # Imported here: the replay module builds on this one
+        from balanceboardreplay import SessionSource
+        url = urlsplit(spec)
+        query = parse_qs(url.query)
+        speed = query.get('speed', ['1'])[0]
+        speed = None if speed == 'max' else float(speed)
+        protocol = query.get('protocol', ['text'])[0]
+        return SessionSource(url.netloc + url.path, speed, protocol, timeout)
+    if spec.startswith('tcp://'):
+        url = urlsplit(spec)
+        return TcpSource(url.hostname, url.port, timeout)
+    if spec.startswith('udp://'):
+        url = urlsplit(spec)
+        return UdpSource(url.hostname or '0.0.0.0', url.port, timeout)
+    return SerialSource(spec, baudrate, timeout)
@@ -0,0 +1,200 @@
+"""
+Balance Board Sway Spectrum - Welch PSD of the COP stream over a sliding window
+Power in the standard posturography bands, median and 95% frequency, for
+COPx (medio-lateral, ML) and COPy (antero-posterior, AP), in cm^2/Hz
+"""
+
+import argparse
+
+import numpy as np
+
+from balanceboardrecorder import read_session
+
+# Posturography bands (Hz): name, low (inclusive), high (exclusive)
+BANDS = (('low', 0.0, 0.3), ('medium', 0.3, 1.0), ('high', 1.0, 3.0))
+AXES = ('ml', 'ap')
+
+
+def spectrum_metrics(freqs, psd, bands=BANDS):
+    """Band powers (cm^2), total power, median and 95% frequency (Hz) of one PSD
+
+    The DC bin is left out: each segment has its mean removed, so anything
+    left there is leakage from the drift of the stance position.
+    """
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else 0.0
+    power = psd[1:] * df
+    total = float(power.sum())
+    result = {'total_power': total}
+    for name, low, high in bands:
+        band = (freqs >= low) & (freqs < high)
+        band[0] = False
+        result[f'{name}_power'] = float(psd[band].sum() * df)
+    if total > 0:
+        cumulative = np.cumsum(power)
+        result['median_freq'] = float(freqs[1 + np.searchsorted(cumulative, 0.5 * total)])
+        result['f95'] = float(freqs[1 + np.searchsorted(cumulative, 0.95 * total)])
+    else:
+        result['median_freq'] = result['f95'] = 0.0
+    return result
+
+
+class SwaySpectrum:
+    """Welch PSD of COPx and COPy over the last window seconds
+
+    The stream is cut into Hann-tapered segments of segment seconds, a new
+    one every hop (segment * (1 - overlap) seconds). Each segment is
+    transformed once, when it completes, and its periodogram kept in a ring;
+    the PSD is the mean of the periodograms in the window, so between hops
+    update() only copies samples. The taper and all buffers are allocated
+    once, when the rate is known: given, or from the median TIME step of the
+    first samples. Only bins up to fmax (Hz) are kept. version counts the
+    hops, so a display can redraw only when there is something new.
+    """
+
+    LEARN_SAMPLES = 64
+
+    def __init__(self, rate=None, segment=10.0, overlap=0.75, window=30.0, fmax=5.0):
+        if not 0 <= overlap < 1:
+            raise ValueError(f"overlap must be in [0, 1): {overlap}")
+        if window < segment:
+            raise ValueError(f"window ({window} s) is shorter than a segment ({segment} s)")
+        self.segment = segment
+        self.overlap = overlap
+        self.window = window
+        self.fmax = fmax
+        self.rate = None
+        self.version = 0
+        # Batches seen before the rate is known
+        self.learning = []
+        if rate is not None:
+            self._allocate(rate)
+
+    def _allocate(self, rate):
+        self.rate = float(rate)
+        self.size = max(2, int(round(self.segment * self.rate)))
+        self.hop = max(1, int(round(self.size * (1 - self.overlap))))
+        self.count = 1 + int((self.window - self.segment) * self.rate // self.hop)
+
+        # Periodic Hann, and the density scaling that goes with it (one-sided)
+        self.taper = np.hanning(self.size + 1)[:-1]
+        freqs = np.fft.rfftfreq(self.size, 1.0 / self.rate)
+        self.bins = int(np.searchsorted(freqs, self.fmax, 'right'))
+        self.freqs = freqs[:self.bins]
+        self.scale = np.full(self.bins, 2.0 / (self.rate * np.sum(self.taper ** 2)))
+        self.scale[0] /= 2
+        if self.size % 2 == 0 and self.bins == len(freqs):
+            self.scale[-1] /= 2  # Nyquist
+
+        # Samples of the segment being filled, and the periodograms of the last count
+        self.buffer = np.empty((2, self.size))
+        self.filled = 0
+        self.work = np.empty((2, self.size))
+        self.periodograms = np.zeros((self.count, 2, self.bins))
+        self.segments = 0
+
+    def update(self, samples):
+        """Take a batch of samples; returns True if a new PSD is ready"""
+        if not len(samples):
+            return False
+        if self.rate is None:
+            self.learning.append(samples)
+            learnt = np.concatenate(self.learning)
+            steps = np.diff(learnt['time'])
+            steps = steps[steps > 0]
+            if len(steps) < self.LEARN_SAMPLES:
+                return False
+            self.learning = []
+            self._allocate(1000.0 / float(np.median(steps)))
+            samples = learnt
+
+        version = self.version
+        x, y = samples['copx'], samples['copy']
+        pos = 0
+        while pos < len(x):
+            take = min(len(x) - pos, self.size - self.filled)
+            self.buffer[0, self.filled:self.filled + take] = x[pos:pos + take]
+            self.buffer[1, self.filled:self.filled + take] = y[pos:pos + take]
+            self.filled += take
+            pos += take
+            if self.filled == self.size:
+                self._transform()
+                # Keep the overlap for the next segment
+                keep = self.size - self.hop
+                self.buffer[:, :keep] = self.buffer[:, self.hop:]
+                self.filled = keep
+        return self.version != version
+
+    def _transform(self):
+        work = self.work
+        np.subtract(self.buffer, self.buffer.mean(axis=1, keepdims=True), out=work)
+        work *= self.taper
+        spectrum = np.fft.rfft(work, axis=1)[:, :self.bins]
+        periodogram = self.periodograms[self.segments % self.count]
+        np.multiply(spectrum.real, spectrum.real, out=periodogram)
+        periodogram += spectrum.imag ** 2
+        periodogram *= self.scale
+        self.segments += 1
+        self.version += 1
+
+    def psd(self):
+        """(freqs, psd) with psd of shape (2, bins), ML then AP; None before the first hop"""
+        if self.rate is None or not self.segments:
+            return None
+        used = min(self.segments, self.count)
+        return self.freqs, self.periodograms[:used].mean(axis=0)
+
+    def result(self):
+        """{'ml': metrics, 'ap': metrics, 'segments': n} (see spectrum_metrics); None until ready"""
+        psd = self.psd()
+        if psd is None:
+            return None
+        freqs, power = psd
+        result = {axis: spectrum_metrics(freqs, power[i]) for i, axis in enumerate(AXES)}
+        result['segments'] = min(self.segments, self.count)
+        return result
+
+    def text(self):
+        """Short multi-line summary for a text box"""
+        result = self.result()
+        if result is None:
+            needed = self.segment if self.rate is None else (self.size - self.filled) / self.rate
+            return f"Spectrum in {needed:.0f} s"
+        lines = []
+        for axis in AXES:
+            m = result[axis]
+            bands = '/'.join(f"{100 * m[f'{name}_power'] / m['total_power']:.0f}"
+                             if m['total_power'] > 0 else '0' for name, _, _ in BANDS)
+            lines.append(f"{axis.upper()}: median {m['median_freq']:.2f} Hz, "
+                         f"F95 {m['f95']:.2f} Hz, bands {bands}%")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sway spectrum (Welch PSD) of recorded sessions")
+    parser.add_argument('sessions', nargs='+')
+    parser.add_argument('--segment', type=float, default=10.0, help="segment length, s")
+    parser.add_argument('--overlap', type=float, default=0.5, help="segment overlap, 0-1")
+    args = parser.parse_args()
+
+    bands = ', '.join(f"{name} {low:g}-{high:g} Hz" for name, low, high in BANDS)
+    for path in args.sessions:
+        _, samples = read_session(path)
+        # The whole recording is the window (with room to spare for every segment)
+        duration = (samples['time'][-1] - samples['time'][0]) / 1000.0 if len(samples) else 0.0
+        spectrum = SwaySpectrum(segment=args.segment, overlap=args.overlap,
+                                window=duration + args.segment)
+        spectrum.update(samples)
+        result = spectrum.result()
+        if result is None:
+            print(f"{path}: shorter than one {args.segment:g} s segment")
+            continue
+        print(f"{path}: {result['segments']} segments of {args.segment:g} s ({bands})")
+        for axis in AXES:
+            m = result[axis]
+            print(f"  {axis.upper()}: total {m['total_power']:.3f} cm², "
+                  f"bands {m['low_power']:.3f}/{m['medium_power']:.3f}/{m['high_power']:.3f} cm², "
+                  f"median {m['median_freq']:.2f} Hz, F95 {m['f95']:.2f} Hz")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Balance Board Timing - the device TIME column (ms) as a stream
+Sample rate, missing samples, duplicates and out-of-order samples, and the
+mapping from device TIME to the host's time.monotonic_ns()
+"""
+
+import numpy as np
+
+from balanceboardparser import SMALL_BATCH
+from balanceboardreport import Reporter
+
+# Steps longer than this many periods are gaps
+GAP_FACTOR = 1.5
+# TIME stepping back by more than this (ms) is a device restart, not a late sample
+RESET_MS = 1000.0
+
+
+class TimeTracker:
+    """Follow device TIME across batches and count what it says about losses
+
+    A sample is a duplicate if its TIME equals the highest seen so far and
+    out of order if lower. A lone TIME that disagrees with both neighbours
+    is corrupt (bad_time) and ignored. Forward steps over GAP_FACTOR periods are gaps,
+    each missing round(step / period) - 1 samples (a late sample has already
+    left its gap, so it counts as missing too). period (ms) is learnt from
+    the first steps unless given, then follows the mean normal step.
+    New losses go to a Reporter (report_interval None: silent).
+    """
+
+    LEARN_STEPS = 32
+
+    def __init__(self, period=None, report_interval=5.0, stream=None, name=None):
+        self.period = period
+        self.reporter = Reporter(report_interval, stream, name)
+
+        self.samples = 0
+        self.missing = 0
+        self.gaps = 0
+        self.largest_gap = 0.0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.resets = 0
+        self.bad_time = 0
+        # Highest TIME so far (None until the first sample or after a resync)
+        self.last = None
+        self.held = None
+        self.step_sum = 0.0
+        self.step_count = 0
+        # Steps seen before period is known
+        self.learning = []
+
+        self.reported = (0, 0, 0, 0, 0)
+
+    @property
+    def rate(self):
+        """Device sample rate in Hz, from the steps between consecutive samples"""
+        return 1000.0 * self.step_count / self.step_sum if self.step_sum else 0.0
+
+    def update(self, samples, resync=False):
+        """Account for a batch; resync=True if samples were skipped just before it"""
+        t = samples['time']
+        if not len(t):
+            return
+        self.samples += len(t)
+        if resync:
+            self.held = None
+            self.last = None
+        if len(t) < SMALL_BATCH and self._normal(t.tolist()):
+            self._maybe_report()
+            return
+
+        # Each sample is judged with the next one, so the last waits for the next batch
+        if self.held is not None:
+            t = np.concatenate(([self.held], t))
+        self.held = t[-1]
+        if len(t) > 1:
+            self._account(t)
+        self._maybe_report()
+
+    def _normal(self, times):
+        """Usual case for a few samples, in Python floats: if every step is a normal
+        one, account for them and return True"""
+        if self.period is None or self.last is None or self.held is None:
+            return False
+        limit = GAP_FACTOR * self.period
+        t = [self.held] + times
+        prev = self.last
+        total = 0.0
+        for now in t:
+            step = now - prev
+            if not 0 < step <= limit:
+                return False
+            total += step
+            prev = now
+        # As in _account: the step to the newest sample is only the look-ahead
+        self.step_sum += total - step
+        self.step_count += len(times)
+        self.period = self.step_sum / self.step_count
+        self.last = t[-2]
+        self.held = t[-1]
+        return True
+
+    def _account(self, t):
+        """Steps up to t[-2]; t[-1] is only the look-ahead"""
+        if self.period is None:
+            steps = np.diff(t)
+            self.learning.extend(steps[steps > 0].tolist())
+            if len(self.learning) >= self.LEARN_STEPS:
+                self.period = float(np.median(self.learning))
+                self.learning = []
+        elif self.last is not None:
+            # Usual case: every step is a normal one
+            steps = np.diff(t, prepend=self.last)
+            if steps.min() > 0 and steps.max() <= GAP_FACTOR * self.period:
+                self.step_sum += float(steps[:-1].sum())
+                self.step_count += len(steps) - 1
+                self.period = self.step_sum / self.step_count
+                self.last = float(t[-2])
+                return
+
+        if self.period is not None:
+            # A single corrupt TIME (e.g. a dropped digit) jumps away from both
+            # neighbours while they agree with each other
+            prev = np.concatenate(([np.nan if self.last is None else self.last], t[:-2]))
+            limit = GAP_FACTOR * self.period
+            across = t[1:] - prev
+            bad = (np.abs(t[:-1] - prev) > limit) & (np.abs(t[1:] - t[:-1]) > limit) \
+                & (across > 0) & (across <= 2 * limit)
+            if bad.any():
+                self.bad_time += int(np.count_nonzero(bad))
+                t = np.concatenate((t[:-1][~bad], t[-1:]))
+        t = t[:-1]
+        if not len(t):
+            return
+
+        # Highest TIME before each sample; the first one after a resync has no step
+        start = -np.inf if self.last is None else self.last
+        ceiling = np.maximum.accumulate(np.concatenate(([start], t[:-1])))
+        step = t - ceiling
+
+        restart = np.flatnonzero(step < -RESET_MS)
+        if len(restart):
+            # Device restarted: account up to it, then start over
+            i = restart[0]
+            self._steps(step[:i])
+            self.resets += 1
+            self.last = None
+            self._account(np.append(t[i:], self.held))
+            return
+        self._steps(step)
+        self.last = max(start, float(t.max()))
+
+    def _steps(self, step):
+        self.duplicates += int(np.count_nonzero(step == 0))
+        self.out_of_order += int(np.count_nonzero(step < 0))
+
+        if self.period is None:
+            return
+        forward = step[(step > 0) & (step < np.inf)]
+        normal = forward <= GAP_FACTOR * self.period
+        self.step_sum += float(forward[normal].sum())
+        self.step_count += int(np.count_nonzero(normal))
+        gaps = forward[~normal]
+        if len(gaps):
+            self.gaps += len(gaps)
+            self.missing += int(np.sum(np.round(gaps / self.period) - 1))
+            self.largest_gap = max(self.largest_gap, float(gaps.max()))
+        if self.step_count:
+            self.period = self.step_sum / self.step_count
+
+    def _maybe_report(self):
+        counts = (self.missing, self.duplicates, self.out_of_order, self.resets, self.bad_time)
+        if counts != self.reported and self.reporter.due():
+            self.report()
+
+    def report(self):
+        """Print what changed since the last report (if anything)"""
+        counts = (self.missing, self.duplicates, self.out_of_order, self.resets, self.bad_time)
+        new = [n - seen for n, seen in zip(counts, self.reported)]
+        labels = ('missing', 'duplicate', 'out of order', 'device restarts', 'bad TIME')
+        changes = ', '.join(f"{n} {label}" for n, label in zip(new, labels) if n)
+        at = f" (at TIME {self.last:.0f} ms)" if self.last is not None else ""
+        self.reporter.report(f"TIME: {changes}{at}" if changes else None)
+        self.reported = counts
+
+    def as_dict(self):
+        return {'rate': self.rate, 'missing': self.missing, 'gaps': self.gaps,
+                'largest_gap': self.largest_gap, 'duplicates': self.duplicates,
+                'out_of_order': self.out_of_order, 'resets': self.resets,
+                'bad_time': self.bad_time}
+
+    def summary(self):
+        return (f"{self.rate:.1f} Hz, {self.missing} missing in {self.gaps} gaps "
+                f"(largest {self.largest_gap:g} ms), {self.duplicates} duplicates, "
+                f"{self.out_of_order} out of order, {self.bad_time} bad TIME")
+
+
+class ClockSync:
+    """Online fit of host time.monotonic_ns() against device TIME (ms)
+
+    Each read gives one observation: the chunk arrived at host_ns, some time
+    after its last sample was taken. USB latency only ever adds delay, so per
+    window (seconds of device time) only the least-delayed observation is
+    kept, and offset and drift are fitted to those by exponentially weighted
+    least squares (weights halve every half_life windows) to follow drift.
+    Observations more than tolerance_ms ahead of the fit are impossible
+    (corrupt TIME) and ignored; if they persist for a few windows the device
+    clock changed and the fit starts over, as it does when TIME steps back.
+    The fit includes the minimum transport delay; pass it as latency_ms if
+    it is known (e.g. measured with a loopback) to have it taken out.
+    """
+
+    RESYNC_WINDOWS = 3
+
+    def __init__(self, window=1.0, half_life=60.0, tolerance_ms=20.0, latency_ms=0.0):
+        self.window_ms = window * 1000.0
+        self.latency = latency_ms * 1e6
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.tolerance = tolerance_ms * 1e6
+        self.resyncs = 0
+        self.rejected = 0
+        self.reset()
+
+    def reset(self):
+        # Fit in relative units: x = device ms since origin, r = host ns - 1e6 x
+        self.origin = None
+        self.last_device = None
+        self.window_end = None
+        self.window_min = None
+        self.sums = [0.0] * 5  # weighted n, x, xx, r, xr
+        self.windows = 0
+        self.offset = None
+        self.slope = 0.0
+        # Device TIME at which the current run of rejected observations began
+        self.rejecting_since = None
+
+    @property
+    def drift_ppm(self):
+        """How much faster the host clock runs than the device's, parts per million"""
+        # slope is ns of host time per ms of device time beyond the nominal 1e6
+        return self.slope
+
+    def observe(self, host_ns, device_ms):
+        """Chunk stamped host_ns whose last sample has device TIME device_ms"""
+        device_ms = float(device_ms)
+        if self.origin is not None and device_ms < self.last_device - RESET_MS:
+            self.resyncs += 1
+            self.reset()
+        if self.origin is None:
+            self.origin = (device_ms, host_ns)
+            self.window_end = device_ms + self.window_ms
+        self.last_device = max(device_ms, self.last_device or device_ms)
+
+        x = device_ms - self.origin[0]
+        r = float(host_ns - self.origin[1]) - 1e6 * x
+        if self.offset is not None and r < self.offset + self.slope * x - self.tolerance:
+            self.rejected += 1
+            if self.rejecting_since is None:
+                self.rejecting_since = device_ms
+            elif device_ms - self.rejecting_since >= self.RESYNC_WINDOWS * self.window_ms:
+                self.resyncs += 1
+                self.reset()
+                self.observe(host_ns, device_ms)
+            return
+        self.rejecting_since = None
+        if self.window_min is None or r < self.window_min[1]:
+            self.window_min = (x, r)
+        if self.windows == 0 and (self.offset is None or r < self.offset):
+            # Provisional until the first window closes
+            self.offset = r
+
+        if device_ms >= self.window_end:
+            self._fit(*self.window_min)
+            self.window_min = None
+            self.window_end += self.window_ms * max(
+                1, np.ceil((device_ms - self.window_end) / self.window_ms))
+
+    def to_host(self, device_ms):
+        """Host time.monotonic_ns() of device TIME(s) as int64 (None before any observation)"""
+        if self.origin is None:
+            return None
+        x = np.asarray(device_ms, np.float64) - self.origin[0]
+        host = 1e6 * x + self.offset + self.slope * x - self.latency
+        return self.origin[1] + np.round(host).astype(np.int64)
+
+    def _fit(self, x, r):
+        n, sx, sxx, sr, sxr = (s * self.decay for s in self.sums)
+        self.sums = [n + 1, sx + x, sxx + x * x, sr + r, sxr + x * r]
+        self.windows += 1
+        n, sx, sxx, sr, sxr = self.sums
+        det = n * sxx - sx * sx
+        if self.windows >= 2 and det > 1e-9 * n * sxx:
+            self.slope = (n * sxr - sx * sr) / det
+            self.offset = (sr - self.slope * sx) / n
+        else:
+            self.offset = r
@@ -3,47 +3,138 @@ Balance Board Data Visualizer - Fast Real-time
 Data format: TIME,F1,F2,F3,F4,COPx,COPy
 """
 
+import argparse
+import threading
+import time
+
+import numpy as np
 import serial
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from matplotlib.patches import Rectangle
 
+from balanceboardacquisition import AcquisitionProcess
+from balanceboardbuffer import SampleRing, TrailBuffer
+from balanceboardcop import CopCheck, add_geometry_args, geometry_from_args
+from balanceboardfilter import LowPassFilter
+from balanceboardframing import StreamDecoder
+from balanceboardmetrics import SwayMetrics
+from balanceboardparser import FIELDS, SAMPLE_DTYPE
+from balanceboardsources import open_source
+from balanceboardspectrum import AXES, BANDS, SwaySpectrum
+from balanceboardtiming import TimeTracker
+
+class FrameScheduler:
+    """Paces rendering at a target fps, independent of the sample rate"""
+
+    def __init__(self, target_fps=60):
+        self.target_fps = target_fps
+        self.period = 1.0 / target_fps
+        self.next_due = None
+        self.last_tick = None
+        self.frames = 0
+        self.skipped = 0
+        # Achieved render rate (exponential moving average)
+        self.fps = 0.0
+
+    def tick(self, now=None):
+        """Call at the start of each frame; returns ms to wait before the next one"""
+        if now is None:
+            now = time.perf_counter()
+
+        if self.last_tick is not None:
+            rate = 1.0 / max(now - self.last_tick, 1e-6)
+            self.fps = rate if self.fps == 0 else 0.9 * self.fps + 0.1 * rate
+        self.last_tick = now
+        self.frames += 1
+
+        if self.next_due is None:
+            self.next_due = now
+        self.next_due += self.period
+        if now > self.next_due:
+            # The previous frame overran: drop the slots it missed rather than
+            # rendering back-to-back to catch up
+            missed = int((now - self.next_due) / self.period) + 1
+            self.skipped += missed
+            self.next_due += missed * self.period
+
+        return max(1, round((self.next_due - now) * 1000))
+
+
 class BalanceBoardVisualizer:
-    def __init__(self, port, baudrate=115200):
-        # Fast serial connection
-        self.ser = serial.Serial(port, baudrate, timeout=0)
-        self.ser.reset_input_buffer()
-        print(f"Connected to {port} at {baudrate} baud\n")
-
-        # Serial buffer
-        self.buffer = ""
-
-        # Current data
-        self.copx = 0
-        self.copy = 0
-        self.f1 = 0
-        self.f2 = 0
-        self.f3 = 0
-        self.f4 = 0
-
-        # Trail storage (last 20 COP positions)
-        self.trail_x = []
-        self.trail_y = []
+    def __init__(self, port, baudrate=115200, max_latency=0.05, history_size=300000,
+                 trail_length=20, blit=True, target_fps=60, protocol='auto',
+                 acquisition='thread', metrics_windows=(10.0,), spectrum=False, lowpass=None,
+                 cop='device', board=None):
+        # 'thread' reads the port on a thread of this process, 'process' in a child
+        # process publishing to shared memory, clear of the GUI's GIL.
+        # port takes a source spec too (see balanceboardsources); 'process' needs a spec
+        if acquisition not in ('thread', 'process'):
+            raise ValueError(f"Unknown acquisition mode: {acquisition}")
+        self.acquisition = None
+        self.source = None
+        self.decoder = None
+        self.reader = None
+
+        # Acquisition -> history -> update(). The history keeps every sample at device
+        # rate (5 min at 1 kHz by default); samples overwritten before the GUI saw
+        # them are counted as dropped
+        if acquisition == 'process':
+            self.acquisition = AcquisitionProcess(port, baudrate, max_latency, protocol,
+                                                  history_size)
+            self.history = self.acquisition.ring
+        else:
+            # Blocking reads on their own thread, never by the GUI
+            self.source = open_source(port, baudrate, max_latency)
+            print(f"Connected to {self.source}\n")
+
+            # CSV lines or binary frames ('auto' detects from the stream)
+            self.decoder = StreamDecoder(protocol)
+            self.history = SampleRing(history_size)
+            self.reader = threading.Thread(target=self.acquire, daemon=True)
+
+        self.read_seq = 0
+        self.dropped = 0
+        # Device-side losses, from TIME; samples the GUI fell behind on are in dropped
+        self.timing = TimeTracker()
+        # Low-pass cutoff (Hz) for everything drawn, to steady the trail (None: raw values)
+        self.lowpass = LowPassFilter(lowpass) if lowpass is not None else None
+        # Host COP from F1-F4 on the board geometry (a BoardGeometry, 60 x 45 cm by
+        # default): checks the device's COP, or replaces it with cop='host'
+        self.cop = CopCheck(board, cop)
+        self.running = False
+
+        # Latest sample, and the last trail_length COP points at full rate
+        self.current = np.zeros((), SAMPLE_DTYPE)
+        self.trail = TrailBuffer(trail_length)
+
+        # Sway metrics over the session and the last metrics_windows seconds (None: off)
+        self.metrics = SwayMetrics(metrics_windows) if metrics_windows is not None else None
+        # Optional sway spectrum panel; its PSD only changes once per hop (2.5 s)
+        self.spectrum = SwaySpectrum() if spectrum else None
+
+        # Redraw only the changing artists each frame (False: full figure redraw)
+        self.blit = blit
+
+        # Render rate, decoupled from the acquisition rate
+        self.scheduler = FrameScheduler(target_fps)
+        self.anim = None
 
         self.setup_plot()
 
     def setup_plot(self):
         """Setup matplotlib figure"""
-        self.fig = plt.figure(figsize=(14, 6))
+        columns = 3 if self.spectrum is not None else 2
+        self.fig = plt.figure(figsize=(7 * columns, 6))
 
         # COP Board Plot
-        self.ax_board = plt.subplot(1, 2, 1)
+        self.ax_board = plt.subplot(1, columns, 1)
         self.ax_board.set_title('Center of Pressure', fontsize=14, fontweight='bold')
         self.ax_board.set_xlabel('X (cm)', fontsize=12)
         self.ax_board.set_ylabel('Y (cm)', fontsize=12)
 
-        # Board dimensions: 60cm x 45cm
-        w, h = 60, 45
+        # Board dimensions
+        w, h = self.cop.geometry.width, self.cop.geometry.height
         board_rect = Rectangle((-w/2, -h/2), w, h, linewidth=3,
                               edgecolor='black', facecolor='lightgray', alpha=0.3)
         self.ax_board.add_patch(board_rect)
@@ -64,12 +155,19 @@ class BalanceBoardVisualizer:
         self.cop_text = self.ax_board.text(0.02, 0.98, '', transform=self.ax_board.transAxes,
                                           fontsize=11, verticalalignment='top',
                                           bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+        self.status_text = self.ax_board.text(0.02, 0.02, '', transform=self.ax_board.transAxes,
+                                             fontsize=9, verticalalignment='bottom', alpha=0.7)
+        self.metrics_text = self.ax_board.text(0.98, 0.98, '', transform=self.ax_board.transAxes,
+                                              fontsize=8, verticalalignment='top',
+                                              horizontalalignment='right', multialignment='left',
+                                              bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
 
         # Force Matrix Plot
-        self.ax_forces = plt.subplot(1, 2, 2)
+        self.ax_forces = plt.subplot(1, columns, 2)
         self.ax_forces.set_title('Force Sensors', fontsize=14, fontweight='bold')
         self.ax_forces.set_xlim(0, 2)
-        self.ax_forces.set_ylim(0, 2)
+        # Room below the grid keeps the total inside the axes (and its blit region)
+        self.ax_forces.set_ylim(-0.4, 2)
         self.ax_forces.set_aspect('equal')
         self.ax_forces.axis('off')
 
@@ -80,6 +178,7 @@ class BalanceBoardVisualizer:
         self.force_patches = []
         self.force_value_texts = []
         self.force_pct_texts = []
+        self.force_label_texts = []
 
         for i, (x, y, label) in enumerate(positions):
             rect = Rectangle((x + 0.05, y + 0.05), 0.9, 0.9,
@@ -87,8 +186,9 @@ class BalanceBoardVisualizer:
             self.ax_forces.add_patch(rect)
             self.force_patches.append(rect)
 
-            self.ax_forces.text(x + 0.5, y + 0.75, label, ha='center', va='center',
-                              fontsize=16, fontweight='bold')
+            label_text = self.ax_forces.text(x + 0.5, y + 0.75, label, ha='center', va='center',
+                                           fontsize=16, fontweight='bold')
+            self.force_label_texts.append(label_text)
 
             val_text = self.ax_forces.text(x + 0.5, y + 0.5, '0.0 Kg', ha='center', va='center',
                                          fontsize=14, fontweight='bold')
@@ -98,57 +198,102 @@ class BalanceBoardVisualizer:
                                          fontsize=12)
             self.force_pct_texts.append(pct_text)
 
-        self.total_text = self.ax_forces.text(1.0, -0.15, 'Total: 0.0 Kg', ha='center', va='top',
+        self.total_text = self.ax_forces.text(1.0, -0.05, 'Total: 0.0 Kg', ha='center', va='top',
                                              fontsize=14, fontweight='bold',
                                              bbox=dict(boxstyle='round', facecolor='yellow', alpha=0.7))
 
+        # Everything update() changes. When blitting, only these are redrawn over the
+        # cached background; the labels are included so the patches don't cover them
+        self.animated_artists = [self.cop_trail, self.cop_point, self.cop_text, self.status_text,
+                                 self.metrics_text,
+                                 *self.force_patches, *self.force_label_texts,
+                                 *self.force_value_texts, *self.force_pct_texts, self.total_text]
+
+        if self.spectrum is not None:
+            self.setup_spectrum(plt.subplot(1, columns, 3))
+
         plt.tight_layout()
 
+    def setup_spectrum(self, ax):
+        """Sway spectrum panel: PSD relative to its peak, so the axes never rescale"""
+        self.ax_spectrum = ax
+        ax.set_title('Sway Spectrum', fontsize=14, fontweight='bold')
+        ax.set_xlabel('Frequency (Hz)', fontsize=12)
+        ax.set_ylabel('PSD / peak', fontsize=12)
+        ax.set_xlim(0, self.spectrum.fmax)
+        ax.set_ylim(0, 1.3)
+        ax.grid(True, alpha=0.3)
+        for (name, low, high), shade in zip(BANDS, (0.15, 0.08, 0.15)):
+            ax.axvspan(low, high, color='gray', alpha=shade, linewidth=0)
+            ax.text((low + high) / 2, 1.12, name, ha='center', va='bottom', fontsize=8, alpha=0.7)
+
+        self.psd_lines = [ax.plot([], [], color=color, linewidth=1.5, label=axis.upper())[0]
+                          for axis, color in zip(AXES, ('tab:blue', 'tab:orange'))]
+        ax.legend(loc='center right', fontsize=9)
+        self.spectrum_text = ax.text(0.98, 0.98, self.spectrum.text(), transform=ax.transAxes,
+                                     fontsize=8, verticalalignment='top',
+                                     horizontalalignment='right', multialignment='left',
+                                     bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+        self.animated_artists += [*self.psd_lines, self.spectrum_text]
+
+    def acquire(self):
+        """Acquisition thread: source -> decoder -> history"""
+        while self.running:
+            try:
+                chunk = self.source.read()
+            except (OSError, EOFError):
+                break
+            if chunk:
+                samples = self.decoder.decode(chunk)
+                if len(samples):
+                    self.history.append(samples)
+
     def read_data(self):
-        """Read data from serial - fast version"""
-        if self.ser.in_waiting > 0:
-            chunk = self.ser.read(self.ser.in_waiting).decode('utf-8', errors='ignore')
-            self.buffer += chunk
-
-            while '\n' in self.buffer:
-                line, self.buffer = self.buffer.split('\n', 1)
-                line = line.strip()
-
-                if line and not any(line.startswith(x) for x in ["Setup", "Taring", "Format", "Force", "Calculating"]):
-                    parts = line.split(',')
-                    if len(parts) == 7:
-                        try:
-                            self.f1 = float(parts[1])
-                            self.f2 = float(parts[2])
-                            self.f3 = float(parts[3])
-                            self.f4 = float(parts[4])
-                            self.copx = float(parts[5])
-                            self.copy = float(parts[6])
-
-                            # Update trail (keep last 20 positions)
-                            self.trail_x.append(self.copx)
-                            self.trail_y.append(self.copy)
-                            if len(self.trail_x) > 20:
-                                self.trail_x.pop(0)
-                                self.trail_y.pop(0)
-                        except:
-                            pass
+        """Take the samples acquired since the last frame"""
+        samples, self.read_seq, lost = self.history.read_since(self.read_seq)
+        self.dropped += lost
+        self.timing.update(samples, resync=lost > 0)
+        samples = self.cop.apply(samples)
+        if self.lowpass is not None:
+            if lost:
+                self.lowpass.reset()
+            samples = self.lowpass.filter(samples)
+        if len(samples):
+            self.current = samples[-1]
+        return samples
+
+    def rejected(self):
+        """Lines the parser rejected so far (banner and status lines not included)"""
+        if self.acquisition is not None:
+            return int(self.history.header[self.history.REJECTED])
+        return self.decoder.stats.rejected
 
     def update(self, frame):
         """Update plots"""
-        self.read_data()
-
-        # Update COP trail
-        if len(self.trail_x) > 0:
-            self.cop_trail.set_data(self.trail_x, self.trail_y)
+        delay = self.scheduler.tick()
+        if self.anim is not None:
+            self.anim.event_source.interval = delay
+
+        samples = self.read_data()
+        f1, f2, f3, f4, copx, copy = (float(self.current[name]) for name in FIELDS[1:])
+
+        # Update COP trail and metrics with every sample since the last frame
+        if len(samples):
+            self.trail.extend(samples['copx'], samples['copy'])
+            self.cop_trail.set_data(*self.trail.view())
+            if self.metrics is not None:
+                self.metrics.update(samples)
+                self.metrics_text.set_text(self.metrics.text())
+            if self.spectrum is not None:
+                self.update_spectrum(samples)
 
         # Update COP current point
-        self.cop_point.set_offsets([[self.copx, self.copy]])
-        self.cop_text.set_text(f'COP: ({self.copx:.1f}, {self.copy:.1f}) cm')
+        self.cop_point.set_offsets([[copx, copy]])
+        self.cop_text.set_text(f'COP: ({copx:.1f}, {copy:.1f}) cm')
 
         # Update forces
-        forces = [self.f2, self.f1, self.f3, self.f4]
-        total = self.f1 + self.f2 + self.f3 + self.f4
+        forces = [f2, f1, f3, f4]
+        total = f1 + f2 + f3 + f4
 
         for i, force in enumerate(forces):
             self.force_value_texts[i].set_text(f'{force:.1f} Kg')
@@ -163,15 +308,40 @@ class BalanceBoardVisualizer:
                 self.force_patches[i].set_alpha(0.3)
 
         self.total_text.set_text(f'Total: {total:.1f} Kg')
-
-        return []
+        self.status_text.set_text(f'{self.scheduler.fps:.0f} fps | {self.timing.rate:.0f} Hz'
+                                  f' | Missing: {self.timing.missing} | Dropped: {self.dropped}'
+                                  f' | Rejected: {self.rejected()} | COP off: {self.cop.diverged}')
+
+        return self.animated_artists
+
+    def update_spectrum(self, samples):
+        """Feed the spectrum; the panel is only touched when a hop completes"""
+        if not self.spectrum.update(samples):
+            if self.spectrum.rate is None or self.spectrum.segments == 0:
+                self.spectrum_text.set_text(self.spectrum.text())
+            return
+        freqs, psd = self.spectrum.psd()
+        peak = psd.max()
+        for line, power in zip(self.psd_lines, psd):
+            line.set_data(freqs, power / peak if peak > 0 else power)
+        self.spectrum_text.set_text(self.spectrum.text())
 
     def start(self):
         """Start visualization"""
         print("Starting visualization...")
         print("Close the plot window to stop\n")
 
-        anim = FuncAnimation(self.fig, self.update, interval=1, blit=False, cache_frame_data=False)
+        self.running = True
+        if self.acquisition is not None:
+            self.acquisition.start()
+        else:
+            self.reader.start()
+
+        # With blit, FuncAnimation caches the static background (axes, grid, board)
+        # and captures it again whenever the window is resized
+        interval = round(1000 / self.scheduler.target_fps)
+        self.anim = FuncAnimation(self.fig, self.update, interval=interval, blit=self.blit,
+                                  cache_frame_data=False)
 
         try:
             plt.show()
@@ -181,17 +351,56 @@ class BalanceBoardVisualizer:
             self.close()
 
     def close(self):
-        self.ser.close()
+        self.running = False
+        rejected = self.rejected()
+        if self.acquisition is not None:
+            ring = self.history
+            oversize = int(ring.header[ring.OVERSIZE])
+            lost_frames = int(ring.header[ring.LOST_FRAMES])
+            self.acquisition.stop()
+            details = f"{rejected} rejected lines"
+        else:
+            if self.reader.is_alive():
+                self.reader.join()
+            self.source.close()
+            oversize, lost_frames = self.decoder.framer.oversize, self.decoder.frames.lost_frames
+            details = f"rejected lines: {self.decoder.stats.summary()}"
         print("\nSerial connection closed")
+        print(f"Dropped {self.dropped} samples ({oversize} oversize lines, "
+              f"{lost_frames} lost frames)")
+        print(f"Parser: {details}")
+        print(f"Device TIME: {self.timing.summary()}")
+        print(f"COP: {self.cop.summary()}")
+        print(f"Rendered {self.scheduler.frames} frames at {self.scheduler.fps:.1f} fps "
+              f"(target {self.scheduler.target_fps}, {self.scheduler.skipped} skipped)")
 
 
 def main():
-    PORT = 'COM7'
-
+    parser = argparse.ArgumentParser(description="Balance board real-time visualizer")
+    parser.add_argument('port', nargs='?', default='COM7',
+                        help="serial port, tcp://host:port, udp://:port, pty:PATH or file:PATH")
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--acquisition', choices=('thread', 'process'), default='thread',
+                        help="read the port on a thread (default) or in a child process")
+    parser.add_argument('--fps', type=float, default=60, help="target render rate (default 60)")
+    parser.add_argument('--trail', type=int, default=20, metavar='SAMPLES',
+                        help="COP trail length (default 20)")
+    parser.add_argument('--spectrum', action='store_true',
+                        help="show the sway spectrum of COPx and COPy")
+    parser.add_argument('--lowpass', type=float, metavar='HZ',
+                        help="low-pass filter forces and COP at this cutoff")
+    add_geometry_args(parser)
+    args = parser.parse_args()
+
+    PORT = args.port
     try:
-        visualizer = BalanceBoardVisualizer(PORT)
+        board = geometry_from_args(args)
+        visualizer = BalanceBoardVisualizer(PORT, args.baudrate, trail_length=args.trail,
+                                            target_fps=args.fps, acquisition=args.acquisition,
+                                            spectrum=args.spectrum, lowpass=args.lowpass,
+                                            cop=args.cop, board=board)
         visualizer.start()
-    except serial.SerialException as e:
+    except (serial.SerialException, OSError) as e:
         print(f"Error: Could not open serial port {PORT}")
         print(f"Details: {e}")
     except Exception as e: